@@ -0,0 +1,147 @@
+from array import array
+
+# Every node a search has reached, stored as parallel arrays instead of state objects
+# it is both the closed set and the trace: a node keeps the index of its parent, the move
+# that led to it and its cost, and the states themselves are dropped once expanded
+# nodes are found by the Zobrist hash of their state, two different states sharing
+# a 64-bit hash would be merged, which is far less likely than running out of memory
+class NodeArena:
+    initial_capacity = 1 << 10
+
+    def __init__(self):
+        self.parents = array('i')   # index of the parent node, -1 for the root
+        self.moves = array('i')     # code of the move from the parent, see MazeSolver.next_states
+        self.costs = array('i')     # weight pushed from the root
+        # Zobrist hash -> node, an open addressing table with linear probing kept at most half full
+        # a dict would cost an entry and two int objects per node, about 4 times as much
+        self.mask = NodeArena.initial_capacity - 1
+        self.keys = array('Q', bytes(8 * NodeArena.initial_capacity))
+        self.slots = array('i', [-1]) * NodeArena.initial_capacity
+
+    def __len__(self):
+        return len(self.parents)
+
+    def __contains__(self, state):
+        return self.find(state.zobrist) != -1
+
+    # the node of the given Zobrist hash, -1 if there is none
+    def find(self, zobrist):
+        keys = self.keys
+        slots = self.slots
+        mask = self.mask
+        slot = zobrist & mask
+        while slots[slot] != -1:
+            if keys[slot] == zobrist:
+                return slots[slot]
+            slot = (slot + 1) & mask
+        return -1
+
+    def add(self, state, parent, move, cost):
+        return self.add_hash(state.zobrist, parent, move, cost)
+
+    # add a node by the Zobrist hash of its state, for searches that keep no state objects
+    def add_hash(self, zobrist, parent, move, cost):
+        node = len(self.parents)
+        self.parents.append(parent)
+        self.moves.append(move)
+        self.costs.append(cost)
+        if 2 * (node + 1) > self.mask + 1:
+            self.grow()
+        self.insert(zobrist, node)
+        return node
+
+    def insert(self, zobrist, node):
+        slots = self.slots
+        mask = self.mask
+        slot = zobrist & mask
+        while slots[slot] != -1:
+            slot = (slot + 1) & mask
+        self.keys[slot] = zobrist
+        slots[slot] = node
+
+    # double the table and insert every node again
+    def grow(self):
+        (keys, slots) = (self.keys, self.slots)
+        capacity = 2 * (self.mask + 1)
+        self.mask = capacity - 1
+        self.keys = array('Q', bytes(8 * capacity))
+        self.slots = array('i', [-1]) * capacity
+        for (zobrist, node) in zip(keys, slots):
+            if node != -1:
+                self.insert(zobrist, node)
+
+    # bytes held by the arrays
+    def nbytes(self):
+        return sum(values.itemsize * len(values)
+                   for values in (self.parents, self.moves, self.costs, self.keys, self.slots))
+
+    # the node of state, None if it was never added
+    def node(self, state):
+        node = self.find(state.zobrist)
+        return None if node == -1 else node
+
+    # move codes from the root to node
+    def moves_to(self, node):
+        moves = []
+        while self.parents[node] != -1:
+            moves.append(self.moves[node])
+            node = self.parents[node]
+        moves.reverse()
+        return moves
+
+# A fixed size table of the states a depth-first search has been through, for IDA*
+# each slot keeps a Zobrist hash, the cost the state was reached with, the age, that is
+# the iteration it was stored in, and a lower bound on the weight still to push learned
+# from the searches below it; its memory is set once, 20 bytes per slot
+# a state maps to a single slot, and when two states collide the table keeps
+# the one from the current iteration, then the one closer to the root,
+# which prunes the larger subtree
+class TranspositionTable:
+    def __init__(self, size):
+        capacity = 1 << max(size - 1, 1).bit_length()
+        self.mask = capacity - 1
+        self.keys = array('Q', bytes(8 * capacity))
+        self.costs = array('i', bytes(4 * capacity))
+        self.ages = array('i', bytes(4 * capacity))    # 0 for an empty slot
+        self.bounds = array('i', bytes(4 * capacity))
+
+    def __len__(self):
+        return self.mask + 1
+
+    # slots in use
+    def used(self):
+        return len(self.ages) - self.ages.count(0)
+
+    def nbytes(self):
+        return sum(values.itemsize * len(values)
+                   for values in (self.keys, self.costs, self.ages, self.bounds))
+
+    # whether the state was already searched in this iteration with a cost no higher than cost
+    def seen(self, zobrist, cost, age):
+        slot = zobrist & self.mask
+        return (self.ages[slot] == age
+                and self.keys[slot] == zobrist
+                and self.costs[slot] <= cost)
+
+    def store(self, zobrist, cost, age):
+        slot = zobrist & self.mask
+        if self.keys[slot] == zobrist and self.ages[slot] != 0:
+            self.costs[slot] = cost
+            self.ages[slot] = age
+        elif self.ages[slot] != age or cost <= self.costs[slot]:
+            self.keys[slot] = zobrist
+            self.costs[slot] = cost
+            self.ages[slot] = age
+            self.bounds[slot] = 0
+
+    # the learned lower bound of the state, 0 if it is not in the table
+    def bound(self, zobrist):
+        slot = zobrist & self.mask
+        if self.keys[slot] == zobrist and self.ages[slot] != 0:
+            return self.bounds[slot]
+        return 0
+
+    def learn(self, zobrist, bound):
+        slot = zobrist & self.mask
+        if self.keys[slot] == zobrist and self.ages[slot] != 0 and bound > self.bounds[slot]:
+            self.bounds[slot] = bound
@@ -0,0 +1,189 @@
+import maze_state as ms
+import maze_portfolio as mp
+import maze_cache as mc
+import maze_pack as mpk
+import argparse
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+DEFAULT_PATTERN = 'input-*.txt'
+
+# Solve many mazes with one algorithm, several at a time, and write one JSON line per maze
+# as soon as it is done, in the order they finish
+#   python -m maze_batch levels/ --algorithm 'A*' --time-limit 60 --output results.jsonl
+# a source is a folder (its files matching --pattern), a glob, a file or - for stdin
+# a file is a stream of levels: each is a line of stone weights and the rows of its maze,
+# and levels are separated by blank lines, so an input-XX.txt file is a stream of one level
+# .xsb and .sok files are Sokoban level packs, read as described in maze_pack
+# a level is known by the path of its file, '#' and its number in the file, from 1
+# with --resume, the levels already in the output file are skipped and new lines appended
+# solutions are looked up in and added to maze_cache.ResultCache, unless --no-cache is given
+
+# the lines of every level in a stream
+def read_levels(file):
+    lines = []
+    for line in file:
+        if line.strip():
+            lines.append(line)
+        elif lines:
+            yield lines
+            lines = []
+    if lines:
+        yield lines
+
+def source_files(source, pattern=DEFAULT_PATTERN):
+    if source == '-':
+        return [source]
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, pattern)))
+    if glob.has_magic(source):
+        return sorted(glob.glob(source))
+    return [source]
+
+# (level, lines) for every level of the sources
+def iterate_levels(sources, pattern=DEFAULT_PATTERN):
+    for source in sources:
+        for file_path in source_files(source, pattern):
+            if file_path == '-':
+                for (number, lines) in enumerate(read_levels(sys.stdin), 1):
+                    yield f"<stdin>#{number}", lines
+                continue
+            if mpk.is_pack(file_path):
+                for (number, (weights, rows)) in enumerate(mpk.read_pack_levels(file_path), 1):
+                    # an empty weights line for a weightless level
+                    header = ' '.join(map(str, weights)) if weights is not None else ''
+                    yield f"{file_path}#{number}", [header] + rows
+                continue
+            with open(file_path, 'r', encoding='utf-8') as file:
+                for (number, lines) in enumerate(read_levels(file), 1):
+                    yield f"{file_path}#{number}", lines
+
+# the levels with a line in a JSON lines output file, a line cut short by a crash is ignored
+def finished_levels(output_path):
+    levels = set()
+    if not os.path.exists(output_path):
+        return levels
+    with open(output_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                levels.add(json.loads(line)['level'])
+            except (ValueError, KeyError, TypeError):
+                pass
+    return levels
+
+# Runs in a worker process: parse and solve one level, from the cache at cache_path if it has it
+def solve_level(task):
+    (level, lines, algorithm, options, time_limit, memory_limit, cache_path) = task
+    try:
+        state = ms.MazeState.from_lines(lines)
+        if cache_path is None:
+            result = mp.run_limited(algorithm, mp.make_solver(algorithm, state, options),
+                                    time_limit, memory_limit)
+        else:
+            with mc.ResultCache(cache_path) as cache:
+                result = cache.get(state, algorithm, options)
+                if result is None:
+                    result = mp.run_limited(algorithm, mp.make_solver(algorithm, state, options),
+                                            time_limit, memory_limit)
+                    cache.put(state, algorithm, options, result)
+    except Exception as error:
+        result = mp.SolverResult(algorithm, f"error: {error!r}")
+    return level, result
+
+def result_line(level, result: mp.SolverResult):
+    return json.dumps({
+        'level': level,
+        'algorithm': result.algorithm,
+        'status': result.status,
+        'steps': result.steps,
+        'weight': result.cost,
+        'nodes': result.state_visited,
+        'time_ms': round(result.time_consume, 2),
+        'memory_mb': round(result.memory_consume, 2),
+        'moves': result.str_path,
+        'cached': result.cached,
+        'stats': result.stats.as_dict() if result.stats is not None else None,
+    })
+
+# Solve every level of the sources and write a line to output as each one finishes
+# skip: levels not to solve again
+# cache_path: file of the maze_cache.ResultCache to use, None for none
+# returns the number of levels solved and the number of levels run
+def run_batch(sources, output, algorithm='A*', options=None, time_limit=None, memory_limit=None,
+              workers=None, pattern=DEFAULT_PATTERN, skip=frozenset(), cache_path=None):
+    if algorithm not in mp.ALGORITHMS:
+        raise ValueError(f"Unknown algorithm: {algorithm}")
+    options = options or {}
+    tasks = ((level, lines, algorithm, options, time_limit, memory_limit, cache_path)
+             for (level, lines) in iterate_levels(sources, pattern)
+             if level not in skip)
+    solved = 0
+    count = 0
+    workers = workers or multiprocessing.cpu_count()
+    with ProcessPoolExecutor(workers, **mp.pool_options()) as executor:
+        pending = set()
+        while True:
+            # only a few levels ahead of the workers are read, never a whole pack
+            for task in itertools.islice(tasks, 2 * workers - len(pending)):
+                pending.add(executor.submit(solve_level, task))
+            if not pending:
+                break
+            (done, pending) = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                (level, result) = future.result()
+                output.write(result_line(level, result) + '\n')
+                output.flush()
+                solved += result.solved
+                count += 1
+    return solved, count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solve many mazes with one algorithm in parallel, '
+                                                 'writing one JSON line per maze as it finishes.')
+    parser.add_argument('sources', nargs='+', help='folders, globs, maze or level stream files, - for stdin')
+    parser.add_argument('--algorithm', default='A*', help='one of ' + ', '.join(mp.ALGORITHMS))
+    parser.add_argument('--pattern', default=DEFAULT_PATTERN, help='files to read in a folder')
+    parser.add_argument('--workers', type=int, help='worker processes, the number of CPUs by default')
+    parser.add_argument('--time-limit', type=float, help='seconds per level')
+    parser.add_argument('--memory-limit', type=int, help='megabytes per level')
+    mp.add_solver_arguments(parser)
+    parser.add_argument('--output', help='JSON lines file to append to, stdout by default')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the levels already in the output file')
+    parser.add_argument('--cache', default=mc.DEFAULT_PATH, help='sqlite file of solutions found before')
+    parser.add_argument('--no-cache', action='store_true', help='solve every level again')
+    args = parser.parse_args(argv)
+    if args.resume and not args.output:
+        parser.error('--resume needs --output')
+
+    options = mp.solver_options(args)
+    skip = finished_levels(args.output) if args.resume else frozenset()
+    start_time = time.time()
+    if args.output:
+        output = open(args.output, 'a', encoding='utf-8')
+        if output.tell() > 0:
+            # a run that was stopped may have left half a line
+            with open(args.output, 'rb') as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    output.write('\n')
+    else:
+        output = sys.stdout
+    try:
+        (solved, count) = run_batch(args.sources, output, args.algorithm, options,
+                                    args.time_limit, args.memory_limit, args.workers,
+                                    args.pattern, skip, None if args.no_cache else args.cache)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"{solved} of {count} levels solved, {len(skip)} skipped, "
+          f"{time.time() - start_time:.2f} s", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import maze_state as ms
+import maze_portfolio as mp
+import maze_batch as mb
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Run solvers on levels again and again, keep the figures and compare them with a baseline
+#   python -m maze_benchmark --algorithms 'A*,UCS' --output results.json
+#   python -m maze_benchmark --algorithms 'A*,UCS' --baseline results.json
+# the scaling of HDA* is measured the same way, one run per number of its workers,
+# the time is then the figure to read:
+#   python -m maze_benchmark --algorithms 'HDA*' --search-workers 1 --output hda-1.json
+#   python -m maze_benchmark --algorithms 'HDA*' --search-workers 4 --baseline hda-1.json
+# the bundled input-XX.txt levels are always run, level packs given as sources are run
+# as well, see maze_batch for what a source can be
+# every (level, algorithm) pair runs in a fresh worker process: warmup runs first, then the
+# measured repetitions, each with a new solver; the time is the median of the repetitions
+# cost is the same on every run, and so are node counts and structure bytes, except for
+# the algorithms that are not deterministic (MazeSolver.deterministic), such as HDA*,
+# whose nodes depend on how its processes are scheduled
+# against a baseline, a pair regresses when it is no longer solved, finds a costlier
+# solution, or its nodes, time or bytes grow past their tolerance; the exit status is 1 then
+# nodes and bytes are not compared for the algorithms that are not deterministic
+
+BUNDLED_FOLDER = os.path.dirname(os.path.abspath(__file__))
+BUNDLED_PATTERN = 'input-*.txt'
+TIME_FLOOR = 5.0    # milliseconds, a time change smaller than this is never a regression
+
+# (field, tolerance option, whether it is the same on every run) of the figures that
+# regress when they grow
+METRICS = (('nodes', 'nodes_tolerance', True),
+           ('time_ms', 'time_tolerance', False),
+           ('structure_bytes', 'memory_tolerance', True))
+
+# Runs in a worker process: the record of one level solved with one algorithm
+def benchmark_level(task):
+    (level, lines, algorithm, options, warmups, repetitions, time_limit) = task
+    record = {'level': level, 'algorithm': algorithm}
+    results = []
+    try:
+        for run in range(0, warmups + repetitions):
+            solver = mp.make_solver(algorithm, ms.MazeState.from_lines(lines), options)
+            result = mp.run_limited(algorithm, solver, time_limit)
+            if run >= warmups or not result.solved:
+                results.append(result)
+            if not result.solved:
+                # a run that failed or timed out is not worth running again
+                break
+    except Exception as error:
+        record['status'] = f"error: {error!r}"
+        return record
+    last = results[-1]
+    times = [result.time_consume for result in results]
+    record.update({
+        'status': last.status,
+        'cost': last.cost,
+        'steps': last.steps,
+        'nodes': last.state_visited,
+        'time_ms': round(statistics.median(times), 2),
+        'time_ms_min': round(min(times), 2),
+        'times_ms': [round(value, 2) for value in times],
+        'structure_bytes': last.stats.structure_bytes,
+        'peak_rss_mb': round(mp.peak_memory(), 2),
+    })
+    return record
+
+# (level, lines) of the bundled levels, known by their file name, then of the sources
+def benchmark_levels(sources, bundled=True):
+    if bundled:
+        for (level, lines) in mb.iterate_levels([os.path.join(BUNDLED_FOLDER, BUNDLED_PATTERN)]):
+            yield os.path.relpath(level, BUNDLED_FOLDER), lines
+    yield from mb.iterate_levels(sources)
+
+# records of every level with every algorithm, in that order
+# report: called with each record as it is done
+def run_benchmark(sources, algorithms, options=None, warmups=1, repetitions=3, time_limit=None,
+                  workers=1, bundled=True, report=None):
+    for algorithm in algorithms:
+        if algorithm not in mp.ALGORITHMS:
+            raise ValueError(f"Unknown algorithm: {algorithm}")
+    options = options or {}
+    tasks = [(level, lines, algorithm, options, warmups, repetitions, time_limit)
+             for (level, lines) in benchmark_levels(sources, bundled)
+             for algorithm in algorithms]
+    records = []
+    # one run at a time by default, so that runs do not slow each other down
+    with ProcessPoolExecutor(workers, **mp.pool_options()) as executor:
+        for record in executor.map(benchmark_level, tasks):
+            records.append(record)
+            if report is not None:
+                report(record)
+    return records
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': multiprocessing.cpu_count(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+def write_results(file_path, records, settings):
+    with open(file_path, 'w', encoding='utf-8') as file:
+        json.dump({'environment': environment(), 'settings': settings, 'results': records},
+                  file, indent=1)
+
+def read_results(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return json.load(file)['results']
+
+# (level, algorithm, what, baseline value, new value, verdict) for every figure that changed
+# beyond its tolerance, verdict is 'regression' or 'improvement'
+# tolerances: relative growth allowed, by tolerance option name, see METRICS
+def compare(baseline, records, tolerances, time_floor=TIME_FLOOR):
+    previous = {(record['level'], record['algorithm']): record for record in baseline}
+    changes = []
+    for record in records:
+        old = previous.get((record['level'], record['algorithm']))
+        if old is None:
+            continue
+        key = (record['level'], record['algorithm'])
+        old_solved = old['status'] == 'solved'
+        new_solved = record['status'] == 'solved'
+        if old_solved != new_solved:
+            changes.append(key + ('status', old['status'], record['status'],
+                                  'improvement' if new_solved else 'regression'))
+        if not (old_solved and new_solved):
+            continue
+        if record['cost'] != old['cost']:
+            changes.append(key + ('cost', old['cost'], record['cost'],
+                                  'regression' if record['cost'] > old['cost'] else 'improvement'))
+        deterministic = mp.ALGORITHMS[record['algorithm']].deterministic
+        for (field, tolerance, repeatable) in METRICS:
+            if repeatable and not deterministic:
+                continue
+            (before, after) = (old[field], record[field])
+            if field == 'time_ms' and abs(after - before) < time_floor:
+                continue
+            if after > before * (1 + tolerances[tolerance]):
+                changes.append(key + (field, before, after, 'regression'))
+            elif after < before * (1 - tolerances[tolerance]):
+                changes.append(key + (field, before, after, 'improvement'))
+    return changes
+
+def format_record(record):
+    if record['status'] != 'solved':
+        return f"{record['level']:<16} {record['algorithm']:<14} {record['status']}"
+    return (f"{record['level']:<16} {record['algorithm']:<14} "
+            f"cost {record['cost']:>6}, nodes {record['nodes']:>9}, "
+            f"time {record['time_ms']:>10.2f} ms, bytes {record['structure_bytes']:>10}, "
+            f"peak {record['peak_rss_mb']:.1f} MB")
+
+def format_change(change):
+    (level, algorithm, what, before, after, verdict) = change
+    if isinstance(before, (int, float)) and isinstance(after, (int, float)) and before:
+        delta = f" ({(after - before) / before:+.1%})"
+    else:
+        delta = ''
+    return f"{verdict}: {level} {algorithm} {what} {before} -> {after}{delta}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the solvers and compare with a baseline.')
+    parser.add_argument('sources', nargs='*', help='level packs to run besides the bundled levels')
+    parser.add_argument('--algorithms', default=','.join(mp.ALGORITHMS),
+                        help='comma separated, from ' + ', '.join(mp.ALGORITHMS))
+    parser.add_argument('--no-bundled', action='store_true', help='only run the given sources')
+    parser.add_argument('--warmups', type=int, default=1)
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--time-limit', type=float, default=60, help='seconds per run')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='runs at once, more than 1 makes the times less reliable')
+    mp.add_solver_arguments(parser)
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--baseline', help='JSON results file of an earlier run to compare with')
+    parser.add_argument('--time-tolerance', type=float, default=0.2, help='relative, 0.2 by default')
+    parser.add_argument('--nodes-tolerance', type=float, default=0.0, help='relative, 0 by default, not used for HDA*')
+    parser.add_argument('--memory-tolerance', type=float, default=0.1, help='relative, 0.1 by default')
+    args = parser.parse_args(argv)
+
+    options = mp.solver_options(args)
+    settings = {'algorithms': args.algorithms.split(','), 'options': options,
+                'warmups': args.warmups, 'repetitions': args.repetitions,
+                'time_limit': args.time_limit}
+    baseline = read_results(args.baseline) if args.baseline else None
+    records = run_benchmark(args.sources, settings['algorithms'], options, args.warmups,
+                            args.repetitions, args.time_limit, args.workers, not args.no_bundled,
+                            report=lambda record: print(format_record(record), flush=True))
+    if args.output:
+        write_results(args.output, records, settings)
+    if baseline is None:
+        return
+    tolerances = {tolerance: getattr(args, tolerance) for (_, tolerance, _) in METRICS}
+    changes = compare(baseline, records, tolerances)
+    for change in changes:
+        print(format_change(change))
+    regressions = sum(change[5] == 'regression' for change in changes)
+    print(f"{regressions} regressions, {len(changes) - regressions} improvements")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
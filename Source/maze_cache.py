@@ -0,0 +1,117 @@
+import maze_state as ms
+import maze_stats as mst
+import maze_portfolio as mp
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maze_cache.sqlite')
+
+# Solutions found in earlier runs, kept in an sqlite file so that a level solved once
+# is not solved again, by the GUI or by maze_batch
+# an entry is found by the hash of the level, the algorithm and its options, and is
+# replayed on the level before it is used: one that does not reach the goal with the
+# cost it claims is dropped, only solved runs are stored
+
+# the level as text: the stone weights in reading order and the rows without trailing
+# spaces, so that two files of the same level with different blank space match
+def canonical_level(state: ms.MazeState):
+    weights = ' '.join(str(weight) for (_, weight) in sorted(state.stones_weight.items()))
+    rows = [''.join(row).rstrip() for row in state.grid]
+    while rows and not rows[-1]:
+        rows.pop()
+    return '\n'.join([weights] + rows)
+
+# options turned off, such as push_mode=False from maze_batch, are left out,
+# so that they match the GUI's solvers built without options
+def cache_key(state: ms.MazeState, algorithm, options=None):
+    options = {name: value for (name, value) in (options or {}).items()
+               if value is not None and value is not False}
+    text = '\n'.join((canonical_level(state), algorithm, json.dumps(options, sort_keys=True)))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+# the replay of moves on state if they lead to the goal pushing exactly cost, None otherwise
+def verify(state: ms.MazeState, moves, cost):
+    try:
+        replay = ms.MazeReplay(state, moves)
+    except ValueError:
+        return None
+    if not replay.final_state.is_goal_state():
+        return None
+    if sum(replay.step_cost(step) for step in range(1, len(replay))) != cost:
+        return None
+    return replay
+
+class ResultCache:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        # several batch workers may write at once, sqlite makes them wait for each other
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                                'key TEXT PRIMARY KEY, algorithm TEXT, moves TEXT, cost INTEGER, '
+                                'nodes INTEGER, time_ms REAL, memory_mb REAL, stats TEXT, created REAL)')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    # the cached SolverResult of the level, None if there is none or it does not replay
+    def get(self, state: ms.MazeState, algorithm, options=None):
+        key = cache_key(state, algorithm, options)
+        row = self.connection.execute('SELECT moves, cost, nodes, time_ms, memory_mb, stats '
+                                      'FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        (moves, cost, nodes, time_ms, memory_mb, stats) = row
+        if verify(state, moves, cost) is None:
+            self.connection.execute('DELETE FROM results WHERE key = ?', (key,))
+            self.connection.commit()
+            return None
+        stats = mst.SearchStats.from_dict(json.loads(stats)) if stats else None
+        return mp.SolverResult(algorithm, 'solved', len(moves), cost, nodes, time_ms, memory_mb,
+                               moves, stats, cached=True)
+
+    def put(self, state: ms.MazeState, algorithm, options, result: mp.SolverResult):
+        if not result.solved:
+            return
+        stats = json.dumps(result.stats.as_dict()) if result.stats is not None else None
+        self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                (cache_key(state, algorithm, options), algorithm, result.str_path,
+                                 result.cost, result.state_visited, result.time_consume,
+                                 result.memory_consume, stats, time.time()))
+        self.connection.commit()
+
+# solve the level of solver unless the cache has it, storing what is solved
+# on a hit the solver's fields are filled in from the cached result instead, path included,
+# and solver.cached is set
+# track_memory: solve under solve_and_track_memory, which measures what the search allocates
+# but makes it several times slower, otherwise memory comes from the search structures
+# returns whether the maze was solved
+def solve_cached(cache: ResultCache, algorithm, solver, options=None, track_memory=False):
+    result = cache.get(solver.initial_state, algorithm, options)
+    solver.cached = result is not None
+    if result is None:
+        solved = solver.solve_and_track_memory() if track_memory else solver.solve_maze()
+        if solved:
+            cache.put(solver.initial_state, algorithm, options, mp.SolverResult.from_solver(algorithm, solver))
+        return solved
+    solver.str_path = result.str_path
+    solver.path = ms.MazeReplay(solver.initial_state, result.str_path)
+    solver.cost = result.cost
+    solver.state_visited = result.state_visited
+    solver.time_consume = result.time_consume
+    solver.memory_consume = result.memory_consume
+    if result.stats is not None:
+        solver.stats = result.stats
+    return True
@@ -0,0 +1,258 @@
+import maze_state as ms
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+# Abstract class
+# A detector tells whether a state can never be solved, it must never report a solvable state
+class DeadlockDetector(ABC):
+    name = ''
+
+    def __init__(self, board: ms.MazeBoard, dead_squares):
+        self.board = board
+        self.dead_squares = dead_squares
+
+    @abstractmethod
+    def is_deadlock(self, state: ms.MazeStateCompress):
+        pass
+
+# a stone on a dead square, this includes pattern 1 of deadlock_patterns.txt
+class SimpleDeadlockDetector(DeadlockDetector):
+    name = 'simple'
+
+    def is_deadlock(self, state: ms.MazeStateCompress):
+        for cell in state.stones:
+            if self.dead_squares[cell]:
+                return True
+        return False
+
+# patterns 2 to 4 of deadlock_patterns.txt
+class PatternDeadlockDetector(DeadlockDetector):
+    name = 'pattern'
+
+    # (walls, stones, walls or stones) neighbour indexes of each pattern
+    PATTERNS = (
+        # pattern 2
+        ((), (), (0, 1, 2)), ((), (), (2, 3, 4)), ((), (), (4, 5, 6)), ((), (), (6, 7, 0)),
+        # pattern 3
+        ((5, 0), (6,), ()), ((7, 2), (0,), ()), ((1, 4), (2,), ()), ((3, 6), (4,), ()),
+        ((6, 1), (0,), ()), ((0, 3), (2,), ()), ((2, 5), (4,), ()), ((4, 7), (6,), ()),
+        # pattern 4
+        ((5, 1), (6, 0), ()), ((7, 3), (0, 2), ()), ((1, 5), (2, 4), ()), ((3, 7), (4, 6), ()),
+    )
+
+    def __init__(self, board: ms.MazeBoard, dead_squares):
+        super().__init__(board, dead_squares)
+        # bit k of a neighbourhood mask stands for the cell at neighbour_offsets[k],
+        # the 8 neighbours counter-clockwise from the cell above
+        (up, left, down, right) = board.directions
+        self.neighbour_offsets = (up, up + left, left, down + left, down, down + right, right, up + right)
+        self.neighbour_bits = {offset: 1 << k for (k, offset) in enumerate(self.neighbour_offsets)}
+        self.pattern_masks = self.find_pattern_masks()
+
+    # for every cell, the neighbourhood masks of stones that make a stone on that cell deadlock
+    # the walls around a cell never change, so each pattern is reduced to the stones it still needs
+    def find_pattern_masks(self):
+        walls = self.board.walls
+        pattern_masks = [()] * self.board.size
+        for cell in range(0, self.board.size):
+            if walls[cell] or self.dead_squares[cell] or cell in self.board.switches:
+                continue
+            wall_mask = 0
+            for (k, offset) in enumerate(self.neighbour_offsets):
+                if 0 <= cell + offset < self.board.size and walls[cell + offset]:
+                    wall_mask |= 1 << k
+            needs = set()
+            for (wall_indexes, stone_indexes, blocked_indexes) in PatternDeadlockDetector.PATTERNS:
+                wall_bits = sum(1 << k for k in wall_indexes)
+                if wall_mask & wall_bits != wall_bits:
+                    continue
+                stone_bits = sum(1 << k for k in stone_indexes)
+                blocked_bits = sum(1 << k for k in blocked_indexes)
+                needs.add(stone_bits | (blocked_bits & ~wall_mask))
+            pattern_masks[cell] = tuple(needs)
+        return pattern_masks
+
+    def is_deadlock(self, state: ms.MazeStateCompress):
+        stones = state.stones
+        for cell in stones:
+            needs = self.pattern_masks[cell]
+            if not needs:
+                continue
+            # the neighbourhood mask of the other stones around this one
+            stone_mask = 0
+            for other in stones:
+                bit = self.neighbour_bits.get(other - cell)
+                if bit is not None:
+                    stone_mask |= bit
+            for need in needs:
+                if stone_mask & need == need:
+                    return True
+        return False
+
+# a stone that is not on a switch and can never move again,
+# blocked along both axes by walls, dead squares or other frozen stones
+class FreezeDeadlockDetector(DeadlockDetector):
+    name = 'freeze'
+
+    def is_deadlock(self, state: ms.MazeStateCompress):
+        (up, left, _, _) = self.board.directions
+        stones = state.stones
+        for cell in stones:
+            if cell in self.board.switches:
+                continue
+            if (self.is_blocked(cell, left, up, stones, frozenset())
+                and self.is_blocked(cell, up, left, stones, frozenset())):
+                return True
+        return False
+
+    # whether the stone on cell can never move along the axis of offset
+    # stones in fixed are assumed frozen and treated as walls, which also stops the recursion
+    def is_blocked(self, cell, offset, other_offset, stones, fixed):
+        walls = self.board.walls
+        (before, after) = (cell - offset, cell + offset)
+        if walls[before] or walls[after] or before in fixed or after in fixed:
+            return True
+        # it can move, but only onto a dead square
+        if self.dead_squares[before] and self.dead_squares[after]:
+            return True
+        fixed = fixed | {cell}
+        for side in (before, after):
+            if side in stones and self.is_blocked(side, other_offset, offset, stones, fixed):
+                return True
+        return False
+
+# a corral is an area ares cannot reach, fenced by stones
+# the fence and the stones inside are searched alone, with every other stone removed:
+# if they can neither be pushed out of the corral nor all onto switches, the state is deadlock
+class CorralDeadlockDetector(DeadlockDetector):
+    name = 'corral'
+    node_limit = 300        # pushes searched per corral before giving up and assuming no deadlock
+    cache_size = 100000
+
+    def __init__(self, board: ms.MazeBoard, dead_squares):
+        super().__init__(board, dead_squares)
+        self.cache = {}
+
+    def is_deadlock(self, state: ms.MazeStateCompress):
+        walls = self.board.walls
+        directions = self.board.directions
+        stones = state.stones
+        reachable = state.reachable()
+        seen = set()
+        for stone in stones:
+            for offset in directions:
+                cell = stone + offset
+                if walls[cell] or reachable[cell] or cell in stones or cell in seen:
+                    continue
+                area = self.find_area(cell, stones, reachable)
+                seen |= area
+                fence = frozenset(s for s in stones
+                                  if any(s + o in area for o in directions))
+                if fence <= self.board.switches:
+                    continue
+                key = (fence, reachable.find(1))
+                if key not in self.cache:
+                    if len(self.cache) >= CorralDeadlockDetector.cache_size:
+                        del self.cache[next(iter(self.cache))]
+                    self.cache[key] = not self.can_break_out(state.ares, fence, area | fence)
+                if self.cache[key]:
+                    return True
+        return False
+
+    # the floor cells connected to cell that ares cannot reach
+    def find_area(self, cell, stones, reachable):
+        walls = self.board.walls
+        area = {cell}
+        stack = [cell]
+        while stack:
+            cell = stack.pop()
+            for offset in self.board.directions:
+                next_cell = cell + offset
+                if (next_cell not in area
+                    and not walls[next_cell]
+                    and not reachable[next_cell]
+                    and next_cell not in stones):
+                    area.add(next_cell)
+                    stack.append(next_cell)
+        return area
+
+    # push-level BFS on the corral stones alone
+    def can_break_out(self, ares, stones, zone):
+        walls = self.board.walls
+        directions = self.board.directions
+        switches = self.board.switches
+        reachable = self.flood(ares, stones)
+        visited = {(stones, reachable.find(1))}
+        q = deque([(stones, reachable)])
+        nodes = 0
+        while q:
+            (stones, reachable) = q.popleft()
+            nodes += 1
+            if nodes > CorralDeadlockDetector.node_limit:
+                return True
+            for stone in stones:
+                for offset in directions:
+                    target = stone + offset
+                    if (not reachable[stone - offset]
+                        or walls[target]
+                        or target in stones
+                        or self.dead_squares[target]):
+                        continue
+                    if target not in zone:
+                        return True
+                    new_stones = (stones - {stone}) | {target}
+                    if new_stones <= switches:
+                        return True
+                    new_reachable = self.flood(stone, new_stones)
+                    key = (new_stones, new_reachable.find(1))
+                    if key not in visited:
+                        visited.add(key)
+                        q.append((new_stones, new_reachable))
+        return False
+
+    def flood(self, ares, stones):
+        walls = self.board.walls
+        reached = bytearray(self.board.size)
+        reached[ares] = 1
+        stack = [ares]
+        while stack:
+            cell = stack.pop()
+            for offset in self.board.directions:
+                next_cell = cell + offset
+                if not reached[next_cell] and not walls[next_cell] and next_cell not in stones:
+                    reached[next_cell] = 1
+                    stack.append(next_cell)
+        return reached
+
+DETECTORS = {detector.name: detector for detector in (SimpleDeadlockDetector,
+                                                       PatternDeadlockDetector,
+                                                       FreezeDeadlockDetector,
+                                                       CorralDeadlockDetector)}
+DEFAULT_DETECTORS = ('simple', 'pattern')
+
+# Runs the chosen detectors in order, and counts how much each one prunes and costs
+class DeadlockEngine:
+    def __init__(self, board: ms.MazeBoard, detectors=DEFAULT_DETECTORS):
+        for name in detectors:
+            if name not in DETECTORS:
+                raise ValueError(f"Unknown deadlock detector: {name}")
+        self.dead_squares = board.dead_squares
+        self.detectors = [DETECTORS[name](board, self.dead_squares) for name in detectors]
+        self.reset()
+
+    def reset(self):
+        self.checked = 0                                            # states checked
+        self.pruned = {detector.name: 0 for detector in self.detectors}        # states found deadlock
+        self.time_spent = {detector.name: 0.0 for detector in self.detectors}  # in seconds
+
+    def is_deadlock(self, state: ms.MazeStateCompress):
+        self.checked += 1
+        for detector in self.detectors:
+            start_time = time.perf_counter()
+            found = detector.is_deadlock(state)
+            self.time_spent[detector.name] += time.perf_counter() - start_time
+            if found:
+                self.pruned[detector.name] += 1
+                return True
+        return False
@@ -0,0 +1,195 @@
+import maze_state as ms
+from collections import deque
+
+INF = 2000000000    # distance of a cell a stone can never be pushed from
+
+# the number of pushes needed to bring a stone from every cell to the switch,
+# for a stone alone on the board, found by pulling the stone backwards from the switch
+def push_distances(board: ms.MazeBoard, switch):
+    walls = board.walls
+    distance = [INF] * board.size
+    distance[switch] = 0
+    q = deque([switch])
+    while q:
+        cell = q.popleft()
+        for offset in board.directions:
+            if (distance[cell + offset] == INF
+                and not walls[cell + offset]
+                and not walls[cell + 2 * offset]):
+                distance[cell + offset] = distance[cell] + 1
+                q.append(cell + offset)
+    return distance
+
+# one phase of the Hungarian algorithm: match row i, 1-based, through a shortest augmenting path
+# u, v are the row and column potentials and p[j] the row matched to column j (0 if free),
+# all 1-based lists that are updated in place
+def augment(cost, u, v, p, i):
+    m = len(p) - 1
+    way = [0] * (m + 1)
+    minv = [float('inf')] * (m + 1)
+    used = [False] * (m + 1)
+    p[0] = i
+    j0 = 0
+    # grow an alternating tree from row i until it reaches a free column
+    while True:
+        used[j0] = True
+        i0 = p[j0]
+        delta = float('inf')
+        j1 = 0
+        row = cost[i0 - 1]
+        for j in range(1, m + 1):
+            if not used[j]:
+                current = row[j - 1] - u[i0] - v[j]
+                if current < minv[j]:
+                    minv[j] = current
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+        for j in range(0, m + 1):
+            if used[j]:
+                u[p[j]] += delta
+                v[j] -= delta
+            else:
+                minv[j] -= delta
+        j0 = j1
+        if p[j0] == 0:
+            break
+    # flip the augmenting path
+    while j0 != 0:
+        j1 = way[j0]
+        p[j0] = p[j1]
+        j0 = j1
+
+# minimum cost assignment of every row to a different column, with len(cost) <= len(cost[0])
+# Hungarian algorithm with potentials, O(rows^2 * columns)
+# returns (total cost, column of each row, column potentials)
+def hungarian(cost):
+    n = len(cost)
+    m = len(cost[0]) if n > 0 else 0
+    u = [0] * (n + 1)
+    v = [0] * (m + 1)
+    p = [0] * (m + 1)
+    for i in range(1, n + 1):
+        augment(cost, u, v, p, i)
+
+    assignment = [0] * n
+    for j in range(1, m + 1):
+        if p[j] != 0:
+            assignment[p[j] - 1] = j - 1
+    return sum(cost[i][assignment[i]] for i in range(0, n)), assignment, v[1:]
+
+# the stone that moved between two stone tuples, as (slot in parent_stones, new cell)
+def moved_stone(parent_stones, stones):
+    if len(stones) == 1:
+        return 0, stones[0]
+    for (k, cell) in enumerate(parent_stones):
+        if cell not in stones:
+            break
+    for new_cell in stones:
+        if new_cell not in parent_stones:
+            return k, new_cell
+
+# A heuristic gives a record for a stone tuple, from scratch with evaluate()
+# or from the record of the parent state with update(), and cost() reads the bound out of it
+# records are None for stones that can never all reach different switches
+
+# lower bound of the weight still to push: every stone is matched to a different switch,
+# and costs its weight times its push distance to that switch
+# walls are taken into account, other stones and ares are not, so it never overestimates
+# the record is (cost, switch index of each stone slot, switch potentials)
+class MatchingHeuristic:
+    def __init__(self, board: ms.MazeBoard):
+        self.board = board
+        self.switches = tuple(sorted(board.switches))
+        tables = [push_distances(board, switch) for switch in self.switches]
+        # for every cell, the push distance to each switch
+        self.distances = [tuple(table[cell] for table in tables) for cell in range(0, board.size)]
+        self.rows = {}
+
+    # the cost matrix row of a stone of this weight on this cell
+    def row(self, cell, weight):
+        key = (cell, weight)
+        if key not in self.rows:
+            self.rows[key] = tuple(weight * distance for distance in self.distances[cell])
+        return self.rows[key]
+
+    def evaluate(self, stones):
+        if len(stones) > len(self.switches):
+            return None
+        cost = [self.row(cell, weight) for (cell, weight) in zip(stones, self.board.stone_weights)]
+        (total, assignment, v) = hungarian(cost)
+        if total >= INF:
+            return None
+        return total, tuple(assignment), tuple(v)
+
+    # only the row of the moved stone changes: it is unmatched and matched again with one
+    # augmenting path, the other rows keep their switches and potentials, O(stones * switches)
+    # this needs every switch matched: a free switch must keep a zero potential, and the one
+    # the moved stone leaves would not, so with more switches than stones it starts over
+    def update(self, record, parent_stones, stones):
+        if stones is parent_stones or stones == parent_stones:
+            return record
+        if len(self.switches) > len(stones):
+            return self.evaluate(stones)
+        (_, assignment, v) = record
+        (k, new_cell) = moved_stone(parent_stones, stones)
+        weights = self.board.stone_weights
+        cells = list(parent_stones)
+        cells[k] = new_cell
+        cost = [self.row(cell, weight) for (cell, weight) in zip(cells, weights)]
+        # matched rows are tight, so their potentials follow from the switch potentials
+        v = [0] + list(v)
+        u = [0] * (len(cells) + 1)
+        p = [0] * len(v)
+        for (i, j) in enumerate(assignment):
+            if i != k:
+                u[i + 1] = cost[i][j] - v[j + 1]
+                p[j + 1] = i + 1
+        augment(cost, u, v, p, k + 1)
+
+        # the rows follow the parent slots, put them in the slot order of stones
+        slot = {cell: i for (i, cell) in enumerate(stones)}
+        new_assignment = [0] * len(cells)
+        total = 0
+        for j in range(1, len(p)):
+            if p[j] != 0:
+                i = p[j] - 1
+                new_assignment[slot[cells[i]]] = j - 1
+                total += cost[i][j - 1]
+        if total >= INF:
+            return None
+        return total, tuple(new_assignment), tuple(v[1:])
+
+    def cost(self, record):
+        return record[0]
+
+# weaker but cheaper lower bound: every stone is pushed to its closest switch,
+# several stones may pick the same one
+# the record is the bound itself, a push only changes the term of the moved stone, O(1)
+class NearestHeuristic:
+    def __init__(self, board: ms.MazeBoard):
+        self.board = board
+        tables = [push_distances(board, switch) for switch in board.switches]
+        self.nearest = [min(table[cell] for table in tables) for cell in range(0, board.size)]
+
+    def evaluate(self, stones):
+        total = sum(weight * self.nearest[cell]
+                    for (cell, weight) in zip(stones, self.board.stone_weights))
+        if total >= INF:
+            return None
+        return total
+
+    def update(self, record, parent_stones, stones):
+        if stones is parent_stones or stones == parent_stones:
+            return record
+        (k, new_cell) = moved_stone(parent_stones, stones)
+        if self.nearest[new_cell] >= INF:
+            return None
+        weight = self.board.stone_weights[k]
+        return record + weight * (self.nearest[new_cell] - self.nearest[parent_stones[k]])
+
+    def cost(self, record):
+        return record
+
+HEURISTICS = {'matching': MatchingHeuristic, 'nearest': NearestHeuristic}
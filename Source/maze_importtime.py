@@ -0,0 +1,76 @@
+import argparse
+import json
+import subprocess
+import sys
+
+# Time to import the solver modules, each in a fresh interpreter, against a budget
+#   python -m maze_importtime --budget 100
+# every worker process of maze_portfolio and maze_batch pays it, so an import must not
+# read any maze or pull in the profiling packages; both are checked along with the time
+
+MODULES = ('maze_solver', 'maze_portfolio', 'maze_batch', 'maze_parallel')
+DEFAULT_BUDGET = 100        # milliseconds per module
+PROFILING_MODULES = ('memory_profiler', 'psutil', 'tracemalloc')
+
+# run in the fresh interpreter: the files other than Python sources opened by the import
+# are seen through an audit hook
+PROBE = '''
+import json, sys, time
+opened = []
+def hook(event, args):
+    if event == 'open' and isinstance(args[0], str) and not args[0].endswith(('.py', '.pyc')):
+        opened.append(args[0])
+sys.addaudithook(hook)
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{'time_ms': elapsed, 'opened': opened,
+                  'profiling': [name for name in {profiling!r} if name in sys.modules]}}))
+'''
+
+class ImportFailed(Exception):
+    pass
+
+def probe(module):
+    process = subprocess.run([sys.executable, '-c', PROBE.format(module=module, profiling=PROFILING_MODULES)],
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        lines = process.stderr.strip().splitlines()
+        raise ImportFailed(lines[-1] if lines else f"exit status {process.returncode}")
+    return json.loads(process.stdout)
+
+# (best time in milliseconds over the repetitions, files opened, profiling modules loaded)
+def measure(module, repetitions=5):
+    probe(module)   # leaves the compiled bytecode in __pycache__
+    runs = [probe(module) for _ in range(0, repetitions)]
+    best = min(run['time_ms'] for run in runs)
+    return best, runs[0]['opened'], runs[0]['profiling']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check that importing the solver modules is cheap.')
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help='milliseconds per module')
+    parser.add_argument('--repetitions', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        try:
+            (best, opened, profiling) = measure(module, args.repetitions)
+        except ImportFailed as error:
+            failed = True
+            print(f"{module}: cannot be imported - {error}")
+            continue
+        problems = []
+        if best > args.budget:
+            problems.append(f"over the budget of {args.budget:.0f} ms")
+        if opened:
+            problems.append('opens ' + ', '.join(opened))
+        if profiling:
+            problems.append('imports ' + ', '.join(profiling))
+        failed = failed or bool(problems)
+        print(f"{module}: {best:.2f} ms" + (' - ' + '; '.join(problems) if problems else ''))
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+import maze_state as ms
+from abc import ABC, abstractmethod
+from collections import deque
+
+# A macro makes a run of pushes of the same stone part of the move that started it,
+# the search never sees the states in between
+# the move then costs the stone's weight times the number of pushes, and since a macro
+# only looks at the state, replaying the moves of a solution makes the same runs again,
+# see MazeSolver.next_states and MazeSolver.replay_moves
+
+# Abstract class
+class Macro(ABC):
+    name = ''
+    optimal = True      # False if the pushes it forces may rule out the cheapest solution
+
+    def __init__(self, board: ms.MazeBoard):
+        self.board = board
+
+    # the stone on cell has just been pushed by board.directions[direction] into state
+    # returns the state after the pushes of the macro and the pushes, as (stone cell, offset),
+    # no pushes if the macro does not apply
+    @abstractmethod
+    def extend(self, state: ms.MazeStateCompress, cell, direction):
+        pass
+
+# a stone pushed into a one-wide tunnel is pushed on through its far end
+# from the mouth, the run starts if the tunnel goes on past the stone: a tunnel of a
+# single cell is a doorway, where a stone may be left while ares goes round another way
+# further in, ares behind the stone has walls on both sides, so all it could do instead
+# is turn back and leave the stone in the tunnel, where it only blocks the way
+# the run stops on a switch, before a wall, a stone or a dead square, and once the
+# stone leaves the tunnel
+class TunnelMacro(Macro):
+    name = 'tunnel'
+
+    def __init__(self, board: ms.MazeBoard):
+        super().__init__(board)
+        # bit 1 if the cell has walls left and right, so it is a tunnel going up and down,
+        # bit 2 if it has walls above and below, a tunnel going left and right
+        (up, left, down, right) = board.directions
+        walls = board.walls
+        self.tunnels = bytearray(self.board.size)
+        for cell in range(0, board.size):
+            if walls[cell]:
+                continue
+            if walls[cell + left] and walls[cell + right]:
+                self.tunnels[cell] |= 1
+            if walls[cell + up] and walls[cell + down]:
+                self.tunnels[cell] |= 2
+
+    def extend(self, state: ms.MazeStateCompress, cell, direction):
+        board = self.board
+        offset = board.directions[direction]
+        # up and down are the even directions
+        bit = 1 << (direction % 2)
+        pushes = []
+        while (self.tunnels[cell] & bit
+               and (self.tunnels[cell + offset] & bit or self.tunnels[cell - offset] & bit)
+               and not board.goals[cell]):
+            target = cell + offset
+            if board.walls[target] or board.dead_squares[target] or target in state.stones:
+                break
+            state = state.push(cell, offset)
+            pushes.append((cell, offset))
+            cell = target
+        return state, pushes
+
+# a goal room is an area made only of switches with a single entrance cell
+# it is filled in a fixed order, found once, such that every switch can still be
+# reached from the entrance with the ones before it taken: a stone pushed onto the
+# entrance from outside, while the room holds exactly the first stones of that order,
+# is pushed along the fewest pushes to the next switch of the order
+# the order does not look at the weights, so with this macro the solution found may
+# not be the cheapest one
+class GoalRoomMacro(Macro):
+    name = 'goal_room'
+    optimal = False
+
+    def __init__(self, board: ms.MazeBoard):
+        super().__init__(board)
+        # for each entrance: (the cells of its room, the fill order, the set of its first
+        # k switches for every k, and {(k, direction): pushes} from the entrance to the switch order[k])
+        self.rooms = {}
+        for (entrance, cells) in self.find_rooms():
+            order = self.fill_order(entrance, cells)
+            if order is None:
+                continue
+            paths = {}
+            for k in range(0, len(order)):
+                for direction in self.entry_directions(entrance, cells):
+                    pushes = self.push_path(entrance, direction, cells, order[:k], order[k])
+                    if pushes is not None:
+                        paths[(k, direction)] = pushes
+            filled = tuple(frozenset(order[:k]) for k in range(0, len(order)))
+            self.rooms[entrance] = (cells, order, filled, paths)
+
+    # (entrance, cells) of the areas of two or more switches, and nothing else,
+    # that the rest of the maze only reaches through the entrance
+    def find_rooms(self):
+        board = self.board
+        rooms = []
+        seen = set()
+        for entrance in range(0, board.size):
+            if board.walls[entrance] or board.goals[entrance]:
+                continue
+            for offset in board.directions:
+                start = entrance + offset
+                if not board.goals[start] or start in seen:
+                    continue
+                cells = {start}
+                stack = [start]
+                packed = True
+                while stack and packed:
+                    cell = stack.pop()
+                    for next_offset in board.directions:
+                        next_cell = cell + next_offset
+                        if board.walls[next_cell] or next_cell == entrance or next_cell in cells:
+                            continue
+                        if not board.goals[next_cell]:
+                            packed = False
+                            break
+                        cells.add(next_cell)
+                        stack.append(next_cell)
+                if packed and len(cells) >= 2:
+                    rooms.append((entrance, frozenset(cells)))
+                    seen |= cells
+        return rooms
+
+    # directions a stone can be pushed onto the entrance with from outside the room
+    def entry_directions(self, entrance, cells):
+        walls = self.board.walls
+        return tuple(direction for (direction, offset) in enumerate(self.board.directions)
+                     if not walls[entrance - offset] and entrance - offset not in cells
+                     and not walls[entrance - 2 * offset])
+
+    # the order to fill the room in, None if there is none: found backwards,
+    # from the full room, by taking out each time the switch nearest to the entrance
+    # in pushes whose stone could have been pushed there last
+    def fill_order(self, entrance, cells):
+        filled = set(cells)
+        directions = self.entry_directions(entrance, cells)
+        order = []
+        while filled:
+            best = None
+            for switch in sorted(filled):
+                others = tuple(filled - {switch})
+                for direction in directions:
+                    pushes = self.push_path(entrance, direction, cells, others, switch)
+                    if pushes is not None and (best is None or len(pushes) < best[0]):
+                        best = (len(pushes), switch)
+            if best is None:
+                return None
+            filled.remove(best[1])
+            order.append(best[1])
+        order.reverse()
+        return tuple(order)
+
+    # the fewest pushes, as (stone cell, offset), taking a stone from the entrance to target,
+    # with ares starting behind it and only walking in the room, on the entrance and on
+    # the cell ares pushed from; None if there are none
+    def push_path(self, entrance, direction, cells, filled, target):
+        offset = self.board.directions[direction]
+        allowed = set(cells) | {entrance, entrance - offset}
+        allowed -= set(filled)
+        start = (entrance, entrance - offset)
+        parent = {start: None}
+        q = deque([start])
+        while q:
+            (stone, ares) = q.popleft()
+            if stone == target:
+                pushes = []
+                key = (stone, ares)
+                while parent[key] is not None:
+                    (key, push) = parent[key]
+                    pushes.append(push)
+                pushes.reverse()
+                return pushes
+            reached = self.flood(ares, stone, allowed)
+            for push_offset in self.board.directions:
+                to = stone + push_offset
+                if stone - push_offset in reached and to in allowed:
+                    key = (to, stone)
+                    if key not in parent:
+                        parent[key] = ((stone, ares), (stone, push_offset))
+                        q.append(key)
+        return None
+
+    # the allowed cells ares can walk to from its cell with the stone on stone
+    def flood(self, ares, stone, allowed):
+        reached = {ares}
+        stack = [ares]
+        while stack:
+            cell = stack.pop()
+            for offset in self.board.directions:
+                next_cell = cell + offset
+                if next_cell in allowed and next_cell != stone and next_cell not in reached:
+                    reached.add(next_cell)
+                    stack.append(next_cell)
+        return reached
+
+    def extend(self, state: ms.MazeStateCompress, cell, direction):
+        room = self.rooms.get(cell)
+        if room is None:
+            return state, []
+        # only the stones of this room, those of other goal rooms do not change its order
+        (cells, order, filled, paths) = room
+        inside = cells.intersection(state.stones)
+        k = len(inside)
+        if k >= len(order) or inside != filled[k]:
+            return state, []
+        pushes = paths.get((k, direction))
+        if pushes is None:
+            return state, []
+        for (stone, offset) in pushes:
+            state = state.push(stone, offset)
+        return state, pushes
+
+MACROS = {macro.name: macro for macro in (TunnelMacro, GoalRoomMacro)}
+DEFAULT_MACROS = ()
+
+# Runs the chosen macros after a push, each one again after any other made more pushes
+class MacroEngine:
+    def __init__(self, board: ms.MazeBoard, macros=DEFAULT_MACROS):
+        for name in macros:
+            if name not in MACROS:
+                raise ValueError(f"Unknown macro: {name}")
+        self.board = board
+        self.macros = [MACROS[name](board) for name in macros]
+
+    # the stone on cell has just been pushed by board.directions[direction] into state
+    # returns the state once no macro applies any more, and every push the macros made
+    def extend(self, state: ms.MazeStateCompress, cell, direction):
+        pushes = []
+        extended = True
+        while extended:
+            extended = False
+            for macro in self.macros:
+                (state, more) = macro.extend(state, cell, direction)
+                if more:
+                    pushes += more
+                    (stone, offset) = more[-1]
+                    cell = stone + offset
+                    direction = self.board.directions.index(offset)
+                    extended = True
+        return state, pushes
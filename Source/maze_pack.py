@@ -0,0 +1,90 @@
+import maze_state as ms
+import argparse
+import mmap
+import os
+import re
+import time
+
+# Level packs in the Sokoban .xsb/.sok format: many mazes in one file, one at a time
+#   python -m maze_pack levels.xsb
+# the file is memory mapped and read a line at a time, so a level is parsed without
+# the rest of the pack being loaded
+# a level is a run of maze rows, lines made of maze characters with at least one wall,
+# floor may be written '-' or '_' as in the standard format
+# the line right before the rows may give the stone weights, after a 'Weights:' marker,
+# or bare as in input-XX.txt files: a bare line of numbers is only taken for weights when
+# there is one per stone of the level, otherwise it is a title such as '1' or '42'
+# a level without weights is weightless, every stone then weighs 1
+# anything else, such as titles, '; comments' or blank lines, separates levels
+
+PACK_EXTENSIONS = ('.xsb', '.sok')
+MAZE_ROW = re.compile(r'[ #@+$*.\-_]*#[ #@+$*.\-_]*$')
+WEIGHTS = re.compile(r'\s*(weights\s*:)?\s*(\d+(\s+\d+)*)\s*$', re.IGNORECASE)
+FLOOR = str.maketrans('-_', '  ')
+
+def is_pack(file_path):
+    return file_path.lower().endswith(PACK_EXTENSIONS)
+
+# the lines of a file, without their line break, read through a memory map
+def read_lines(file_path):
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for line in iter(data.readline, b''):
+                yield line.decode('utf-8', 'replace').rstrip('\r\n')
+
+# the weights of the line before rows, None if it gives none
+def level_weights(line, rows):
+    match = WEIGHTS.match(line) if line is not None else None
+    if match is None:
+        return None
+    weights = list(map(int, match.group(2).split()))
+    if match.group(1) is None and len(weights) != sum(row.count('$') + row.count('*') for row in rows):
+        return None
+    return weights
+
+# (weights, rows) of every level of a pack, weights is None for a weightless level
+def read_pack_levels(file_path):
+    # a weights line only counts right before the rows
+    previous = None
+    rows = []
+    for line in read_lines(file_path):
+        if MAZE_ROW.match(line):
+            rows.append(line.translate(FLOOR))
+            continue
+        if rows:
+            yield level_weights(previous, rows), rows
+            rows = []
+        previous = line
+    if rows:
+        yield level_weights(previous, rows), rows
+
+# (number, MazeState) of every level of a pack, numbered from 1
+# raises ValueError, with the level number, for a level that is not a valid maze
+def read_pack(file_path):
+    for (number, (weights, rows)) in enumerate(read_pack_levels(file_path), 1):
+        try:
+            yield number, ms.MazeState.from_rows(weights, rows)
+        except ValueError as error:
+            raise ValueError(f"{file_path}, level {number}: {error}") from None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the levels of .xsb/.sok packs and time their parsing.')
+    parser.add_argument('packs', nargs='+')
+    args = parser.parse_args(argv)
+    for file_path in args.packs:
+        start_time = time.perf_counter()
+        count = 0
+        try:
+            for (count, _) in read_pack(file_path):
+                pass
+        except ValueError as error:
+            print(error)
+            continue
+        elapsed = time.perf_counter() - start_time
+        print(f"{file_path}: {count} levels in {elapsed:.2f} s, "
+              f"{count / elapsed if elapsed > 0 else 0:.0f} levels/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+import maze_state as ms
+import maze_solver as mso
+import maze_heuristic as mh
+import maze_queue as mq
+import maze_stats as mst
+import multiprocessing
+import queue
+import sys
+import time
+
+# Hash distributed A* (HDA*): every state belongs to one worker process, chosen by its
+# Zobrist hash, and only that worker opens, closes and expands it
+# successors owned by another worker are sent to it in batches through its inbox queue
+#
+# costs are weights, so a state can first be closed with more than its lowest cost:
+# a worker opens it again when a cheaper copy arrives
+# the cheapest goal found so far is shared, every worker drops what costs as much,
+# and the search is over once no worker has anything cheaper left and no batch is on its way
+# workers count the batches they send and receive, and say when they are idle;
+# the main process ends the search after two sweeps that see every worker idle
+# and as many batches received as sent, with no count changing in between
+
+BATCH_SIZE = 64             # successors sent to another worker at once
+EXPANSIONS_PER_POLL = 64    # states expanded between two looks at the inbox
+
+# best is the cost of the cheapest goal found so far and goal its Zobrist hash,
+# both set under best_lock
+def hda_worker(rank, workers, initial_state, options, inboxes, results,
+               sent, received, idle, best, best_lock, goal):
+    solver = mso.MazeSolverAStar(initial_state, **options)
+    board = solver.board
+    heuristic = solver.heuristic
+    inbox = inboxes[rank]
+    # an entry is (f, cost, ares, stones, zobrist, parent zobrist, move code, heuristic record)
+    open_list = mq.QUEUES[solver.queue]()
+    closed = {}     # zobrist -> (cost, parent zobrist, move code)
+    outboxes = [[] for _ in range(0, workers)]
+    stats = mst.SearchStats()
+    sample = None   # an open list entry, to size the open list
+
+    def send(owner):
+        sent[rank] += 1
+        inboxes[owner].put(outboxes[owner])
+        outboxes[owner] = []
+
+    def add(entry):
+        closed_entry = closed.get(entry[4])
+        if closed_entry is None or entry[1] < closed_entry[0]:
+            open_list.push(entry[0], entry[1], entry)
+        else:
+            stats.duplicates += 1
+
+    while True:
+        # take every batch waiting, and wait for one when there is nothing to expand
+        message = None
+        try:
+            if open_list:
+                message = inbox.get_nowait()
+            else:
+                idle[rank] = 1
+                message = inbox.get(timeout=0.05)
+        except queue.Empty:
+            pass
+        while message is not None:
+            if isinstance(message, tuple):
+                # control messages once the search is over
+                if message[0] == 'stop':
+                    stats.deadlocks = sum(solver.deadlock_engine.pruned.values())
+                    stats.closed_size = len(closed)
+                    stats.structure_bytes = sys.getsizeof(closed) + solver.reachable_cache_bytes()
+                    if closed:
+                        stats.structure_bytes += len(closed) * mst.entry_bytes(next(iter(closed.values())))
+                    if sample is not None:
+                        stats.structure_bytes += stats.open_peak * mst.entry_bytes(sample)
+                    results.put(('stats', rank, stats))
+                    return
+                if message[0] == 'parent':
+                    (cost, parent, move) = closed[message[1]]
+                    results.put(('parent', parent, move))
+            else:
+                idle[rank] = 0
+                received[rank] += 1
+                for entry in message:
+                    add(entry)
+            try:
+                message = inbox.get_nowait()
+            except queue.Empty:
+                message = None
+
+        for _ in range(0, EXPANSIONS_PER_POLL):
+            if not open_list:
+                break
+            entry = sample = open_list.pop()
+            (f, cost, ares, stones, zobrist, parent, move, record) = entry
+            if f >= best.value:
+                # keys come out in order, nothing left here can beat the best goal
+                open_list = mq.QUEUES[solver.queue]()
+                break
+            closed_entry = closed.get(zobrist)
+            if closed_entry is not None and closed_entry[0] <= cost:
+                stats.duplicates += 1
+                continue
+            closed[zobrist] = (cost, parent, move)
+            stats.expanded += 1
+
+            state = ms.MazeStateCompress(board, ares, stones, zobrist)
+            if solver.is_deadlock(state):
+                solver.forget(state)
+                continue
+            if state.is_goal_state():
+                with best_lock:
+                    if cost < best.value:
+                        best.value = cost
+                        goal.value = zobrist
+                continue
+
+            for (new_state, step_cost, new_move) in solver.next_states(state):
+                stats.generated += 1
+                new_record = heuristic.update(record, stones, new_state.stones)
+                if new_record is None:
+                    solver.forget(new_state)
+                    continue
+                new_cost = cost + step_cost
+                new_f = new_cost + heuristic.cost(new_record)
+                if new_f >= best.value:
+                    solver.forget(new_state)
+                    continue
+                new_entry = (new_f, new_cost, new_state.ares, new_state.stones, new_state.zobrist,
+                             zobrist, new_move, new_record)
+                owner = new_state.zobrist % workers
+                if owner == rank:
+                    add(new_entry)
+                else:
+                    # its flood fill is only of use to the worker that expands it
+                    solver.forget(new_state)
+                    outboxes[owner].append(new_entry)
+                    if len(outboxes[owner]) >= BATCH_SIZE:
+                        send(owner)
+            if len(open_list) > stats.open_peak:
+                stats.open_peak = len(open_list)
+
+        # do not keep the other workers waiting for a batch to fill up
+        for owner in range(0, workers):
+            if outboxes[owner]:
+                send(owner)
+
+        # an open list of states all as costly as the best goal counts as empty
+        if open_list and open_list.min_key() >= best.value:
+            open_list = mq.QUEUES[solver.queue]()
+
+# MazeSolver class using hash distributed A* over several processes, see above
+# workers: number of worker processes, the number of CPUs by default
+# states are normalized as with normalize_player, which this solver always uses
+class MazeSolverHDAStar(mso.MazeSolverAStar):
+    # the nodes each worker expands depend on when the batches of the others arrive
+    deterministic = False
+
+    def __init__(self, initial_state, workers=None, **options):
+        options['normalize_player'] = True
+        super().__init__(initial_state, **options)
+        self.options = options
+        self.workers = workers or multiprocessing.cpu_count()
+
+    def solve_maze(self):
+        start_time = time.time()
+        self.cost = 0
+        self.path = []
+        self.str_path = ''
+        self.state_visited = 0
+        self.deadlock_engine.reset()
+        self.stats = mst.SearchStats()
+
+        if self.initial_state.is_goal_state():
+            self.path = ms.MazeReplay(self.initial_state, '')
+            self.finish_search(start_time)
+            return True
+
+        record = self.heuristic.evaluate(self.root_state.stones)
+        if record is None:
+            self.finish_search(start_time)
+            return False
+
+        workers = self.workers
+        context = multiprocessing.get_context()
+        inboxes = [context.Queue() for _ in range(0, workers)]
+        results = context.Queue()
+        # one slot per worker, and the last one for this process
+        sent = context.RawArray('q', workers + 1)
+        received = context.RawArray('q', workers + 1)
+        idle = context.RawArray('b', workers)
+        best_lock = context.Lock()
+        best = context.RawValue('q', mh.INF)
+        goal = context.RawValue('Q', 0)
+        processes = [context.Process(target=hda_worker,
+                                     args=(rank, workers, self.initial_state, self.options,
+                                           inboxes, results, sent, received, idle,
+                                           best, best_lock, goal))
+                     for rank in range(0, workers)]
+        for process in processes:
+            process.start()
+
+        root = self.root_state
+        sent[workers] += 1
+        inboxes[root.zobrist % workers].put([(self.heuristic.cost(record), 0, root.ares, root.stones,
+                                              root.zobrist, None, -1, record)])
+        try:
+            # wait for two sweeps in a row that see everything quiet
+            previous = None
+            while True:
+                time.sleep(0.01)
+                sweep = (all(idle), sum(sent), sum(received))
+                if sweep[0] and sweep[1] == sweep[2] and sweep == previous:
+                    break
+                previous = sweep
+
+            solved = best.value < mh.INF
+            if solved:
+                # follow the parents back from the goal, asking each state's owner
+                moves = []
+                zobrist = goal.value
+                while zobrist is not None:
+                    inboxes[zobrist % workers].put(('parent', zobrist))
+                    (_, parent, move) = results.get()
+                    if parent is not None:
+                        moves.append(move)
+                    zobrist = parent
+                moves.reverse()
+                self.trace_moves(moves)
+
+            for inbox in inboxes:
+                inbox.put(('stop',))
+            worker_stats = []
+            for _ in range(0, workers):
+                (_, _, stats) = results.get()
+                self.state_visited += stats.expanded
+                worker_stats.append(stats)
+        finally:
+            for process in processes:
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+
+        # the counters are those of the workers, this process only measures the time
+        self.finish_search(start_time)
+        self.stats.expanded = 0
+        for stats in worker_stats:
+            self.stats.add(stats)
+        self.memory_consume = self.stats.structure_bytes / (1024 * 1024)
+        return solved
@@ -0,0 +1,255 @@
+import maze_state as ms
+import maze_solver as mso
+import maze_parallel as mpar
+import maze_macro as mm
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+try:
+    import resource
+except ImportError:     # not on Windows, memory limits are then ignored
+    resource = None
+
+ALGORITHMS = {
+    'BFS': mso.MazeSolverBFS,
+    'DFS': mso.MazeSolverDFS,
+    'UCS': mso.MazeSolverUCS,
+    'A*': mso.MazeSolverAStar,
+    'Bidirectional': mso.MazeSolverBidirectional,
+    'IDA*': mso.MazeSolverIDAStar,
+    'HDA*': mpar.MazeSolverHDAStar,
+}
+DEFAULT_ALGORITHMS = ('BFS', 'DFS', 'UCS', 'A*')
+# algorithms whose solution always has the lowest weight, unless options rule it out, see is_optimal
+OPTIMAL_ALGORITHMS = frozenset(('UCS', 'A*', 'Bidirectional', 'IDA*', 'HDA*'))
+# options only some algorithms take, left out for the others, so that one set of options
+# can be given to every algorithm of a run
+ALGORITHM_OPTIONS = {'workers': frozenset(('HDA*',))}
+
+# whether algorithm with these options always finds the solution of lowest weight:
+# a macro that is not optimal, such as goal_room, may rule that solution out
+def is_optimal(algorithm, options):
+    return (algorithm in OPTIMAL_ALGORITHMS
+            and all(name in mm.MACROS and mm.MACROS[name].optimal
+                    for name in options.get('macros') or ()))
+
+# the solver of algorithm for maze_state, with the options it takes
+def make_solver(algorithm, maze_state, options):
+    options = {name: value for (name, value) in options.items()
+               if name not in ALGORITHM_OPTIONS or algorithm in ALGORITHM_OPTIONS[name]}
+    return ALGORITHMS[algorithm](maze_state, **options)
+
+# What a solver run leaves behind, small enough to send back from a worker process
+class SolverResult:
+    def __init__(self, algorithm, status, steps=-1, cost=0, state_visited=0,
+                 time_consume=0.0, memory_consume=0.0, str_path='', stats=None, cached=False):
+        self.algorithm = algorithm
+        self.status = status                    # 'solved', 'no solution', 'time limit', 'memory limit', 'cancelled' or an error
+        self.steps = steps                      # -1 if there is no path
+        self.cost = cost
+        self.state_visited = state_visited
+        self.time_consume = time_consume        # in milliseconds (ms)
+        self.memory_consume = memory_consume    # in megabytes (MB)
+        self.str_path = str_path
+        self.stats = stats                      # maze_stats.SearchStats of the run, None if it did not start
+        self.cached = cached                    # whether it comes from maze_cache instead of a new run
+
+    @classmethod
+    def from_solver(cls, algorithm, solver: mso.MazeSolver, status='solved'):
+        return cls(algorithm, status, len(solver.path) - 1, solver.cost, solver.state_visited,
+                   solver.time_consume, solver.memory_consume, solver.str_path, solver.stats,
+                   solver.cached)
+
+    @property
+    def solved(self):
+        return self.status == 'solved'
+
+    # the block of an output-XX.txt file for this run, the stats line comes after the path,
+    # then a note for a result from maze_cache, whose time and memory are of an earlier run
+    def format(self):
+        block = (f"{self.algorithm}\n"
+                 f"Steps: {self.steps}, "
+                 f"Weight: {self.cost}, "
+                 f"Node: {self.state_visited}, "
+                 f"Time (ms): {self.time_consume:.2f}, "
+                 f"Memory (MB): {self.memory_consume:.2f}\n"
+                 f"{self.str_path}\n")
+        if self.stats is not None:
+            block += self.stats.format() + '\n'
+        if self.cached:
+            block += "Cached: time and memory are those of an earlier run\n"
+        return block
+
+def write_output(file_path, results):
+    with open(file_path, 'w', encoding='utf-8') as file:
+        for result in results:
+            file.write(result.format())
+
+# output-XX.txt for input-XX.txt, in the same folder
+def output_path(input_path):
+    (folder, name) = os.path.split(input_path)
+    return os.path.join(folder, 'output-' + name[6:])
+
+class TimeLimitExceeded(Exception):
+    pass
+
+def raise_time_limit(signum, frame):
+    raise TimeLimitExceeded()
+
+# peak memory of this process so far, in megabytes (MB)
+def peak_memory():
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+# ProcessPoolExecutor options for a fresh process per task where the Python version allows it,
+# so that limits and peak memory are the task's own
+# the executor's workers may start processes of their own, as HDA* does
+def pool_options():
+    if sys.version_info >= (3, 11):
+        return {'max_tasks_per_child': 1}
+    return {}
+
+# Runs in a worker process: solve one maze with one algorithm
+# time_limit in seconds, memory_limit in megabytes of address space for the whole worker,
+# each only where the platform supports it
+def run_solver(algorithm, file_path, options, time_limit=None, memory_limit=None):
+    solver = make_solver(algorithm, ms.MazeState.from_file(file_path), options)
+    return run_limited(algorithm, solver, time_limit, memory_limit)
+
+# solve_maze() of a solver already built, under the limits of run_solver
+def run_limited(algorithm, solver: mso.MazeSolver, time_limit=None, memory_limit=None):
+    if memory_limit is not None and resource is not None:
+        (_, hard) = resource.getrlimit(resource.RLIMIT_AS)
+        limit = memory_limit * 1024 * 1024
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    if time_limit is not None and hasattr(signal, 'setitimer'):
+        signal.signal(signal.SIGALRM, raise_time_limit)
+        signal.setitimer(signal.ITIMER_REAL, time_limit)
+
+    before = peak_memory()
+    start_time = time.time()
+    try:
+        status = 'solved' if solver.solve_maze() else 'no solution'
+    except TimeLimitExceeded:
+        status = 'time limit'
+    except MemoryError:
+        status = 'memory limit'
+    finally:
+        if time_limit is not None and hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    if status not in ('solved', 'no solution'):
+        # the solver did not get to fill in its own fields
+        solver.finish_search(start_time)
+        solver.path = []
+        solver.str_path = ''
+    solver.memory_consume = max(peak_memory() - before, 0.0)
+    return SolverResult.from_solver(algorithm, solver, status)
+
+# Runs in a worker process of run_portfolio: run_solver, and its result put on results
+def portfolio_worker(results, algorithm, file_path, options, time_limit, memory_limit):
+    try:
+        result = run_solver(algorithm, file_path, options, time_limit, memory_limit)
+    except Exception as error:
+        result = SolverResult(algorithm, f"error: {error!r}")
+    results.put(result)
+
+# Solve one maze with every algorithm at once, one worker process each
+# first_optimal: stop the others as soon as an optimal algorithm finds a solution, see is_optimal
+# workers: algorithms run at once, all of them by default
+# returns the results in the order of algorithms
+def run_portfolio(file_path, algorithms=DEFAULT_ALGORITHMS, options=None,
+                  time_limit=None, memory_limit=None, first_optimal=False, workers=None):
+    for algorithm in algorithms:
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm: {algorithm}")
+    options = options or {}
+    workers = workers or len(algorithms)
+    # the processes are started here, not by an executor, so that they can be stopped
+    # in the middle of a run; they are not daemons, so HDA* can start its own workers
+    results_queue = multiprocessing.Queue()
+    waiting = list(algorithms)
+    running = {}
+    results = {}
+    try:
+        while waiting or running:
+            while waiting and len(running) < workers:
+                algorithm = waiting.pop(0)
+                process = multiprocessing.Process(target=portfolio_worker,
+                                                  args=(results_queue, algorithm, file_path, options,
+                                                        time_limit, memory_limit))
+                process.start()
+                running[algorithm] = process
+            try:
+                result = results_queue.get(timeout=0.1)
+            except queue.Empty:
+                # a process that died without a result, killed by the system for instance;
+                # one that put its result before exiting has it in the queue already
+                for (algorithm, process) in list(running.items()):
+                    if process.exitcode is not None and results_queue.empty():
+                        process.join()
+                        del running[algorithm]
+                        results[algorithm] = SolverResult(algorithm, f"error: exit code {process.exitcode}")
+                continue
+            running.pop(result.algorithm).join()
+            results[result.algorithm] = result
+            if first_optimal and result.solved and is_optimal(result.algorithm, options):
+                break
+    finally:
+        for process in running.values():
+            process.terminate()
+        for process in running.values():
+            process.join()
+        for algorithm in list(running) + waiting:
+            results[algorithm] = SolverResult(algorithm, 'cancelled')
+        results_queue.close()
+    return [results[algorithm] for algorithm in algorithms]
+
+# the command line options of the solvers, shared by the portfolio, batch and benchmark CLIs
+def add_solver_arguments(parser):
+    parser.add_argument('--push-mode', action='store_true')
+    parser.add_argument('--normalize-player', action='store_true')
+    parser.add_argument('--macros', help='comma separated, from ' + ', '.join(mm.MACROS))
+    parser.add_argument('--search-workers', type=int, help='worker processes of HDA*, the number of CPUs by default')
+
+# the solver options of parsed arguments, see add_solver_arguments and make_solver
+def solver_options(args):
+    options = {'push_mode': args.push_mode, 'normalize_player': args.normalize_player}
+    if args.macros:
+        options['macros'] = tuple(args.macros.split(','))
+    if args.search_workers:
+        options['workers'] = args.search_workers
+    return options
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solve a maze with several algorithms in parallel '
+                                                 'and write its output file.')
+    parser.add_argument('input', help='maze file, such as input-08.txt')
+    parser.add_argument('--algorithms', default=','.join(DEFAULT_ALGORITHMS),
+                        help='comma separated, from ' + ', '.join(ALGORITHMS))
+    parser.add_argument('--time-limit', type=float, help='seconds per algorithm')
+    parser.add_argument('--memory-limit', type=int, help='megabytes per algorithm')
+    parser.add_argument('--first-optimal', action='store_true',
+                        help='stop the others once an optimal algorithm finds a solution')
+    add_solver_arguments(parser)
+    parser.add_argument('--output', help='output file, output-XX.txt next to the input by default')
+    args = parser.parse_args(argv)
+
+    options = solver_options(args)
+    results = run_portfolio(args.input, args.algorithms.split(','), options,
+                            args.time_limit, args.memory_limit, args.first_optimal)
+    write_output(args.output or output_path(args.input), results)
+    for result in results:
+        print(f"{result.algorithm}: {result.status}, weight {result.cost}, "
+              f"{result.state_visited} nodes, {result.time_consume:.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import heapq
+from abc import ABC, abstractmethod
+
+# Abstract class
+# A priority queue of items ordered by (key, tie_break), both small non-negative integers,
+# items with the same (key, tie_break) come out last in, first out
+class PriorityQueue(ABC):
+    def __init__(self):
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @abstractmethod
+    def push(self, key, tie_break, item):
+        pass
+
+    # the item with the smallest (key, tie_break)
+    @abstractmethod
+    def pop(self):
+        pass
+
+    # the smallest key in the queue, without popping
+    @abstractmethod
+    def min_key(self):
+        pass
+
+# plain tuples on heapq, the counter keeps heapq from ever comparing two items
+class HeapQueue(PriorityQueue):
+    name = 'heap'
+
+    def __init__(self):
+        super().__init__()
+        self.heap = []
+        self.counter = 0
+
+    def push(self, key, tie_break, item):
+        self.counter -= 1
+        heapq.heappush(self.heap, (key, tie_break, self.counter, item))
+        self.size += 1
+
+    def pop(self):
+        self.size -= 1
+        return heapq.heappop(self.heap)[3]
+
+    def min_key(self):
+        return self.heap[0][0]
+
+# one bucket per key, in a list indexed by the key
+# each bucket holds a stack per tie break, and a small heap of the tie breaks in use
+# the keys popped by UCS, and by A* with a consistent heuristic, never decrease,
+# so the cursor to the smallest key only moves forward and a pop is amortized O(1)
+class BucketQueue(PriorityQueue):
+    name = 'bucket'
+
+    def __init__(self):
+        super().__init__()
+        self.buckets = []
+        self.current = 0        # no bucket before this key holds an item
+
+    def push(self, key, tie_break, item):
+        buckets = self.buckets
+        if key >= len(buckets):
+            buckets.extend([None] * (key + 1 - len(buckets)))
+        bucket = buckets[key]
+        if bucket is None:
+            bucket = buckets[key] = ([], {})
+        (tie_breaks, stacks) = bucket
+        stack = stacks.get(tie_break)
+        if stack is None:
+            stack = stacks[tie_break] = []
+            heapq.heappush(tie_breaks, tie_break)
+        stack.append(item)
+        if key < self.current:
+            self.current = key
+        self.size += 1
+
+    def pop(self):
+        buckets = self.buckets
+        (tie_breaks, stacks) = buckets[self.min_key()]
+        stack = stacks[tie_breaks[0]]
+        item = stack.pop()
+        if not stack:
+            del stacks[heapq.heappop(tie_breaks)]
+            if not tie_breaks:
+                buckets[self.current] = None
+        self.size -= 1
+        return item
+
+    def min_key(self):
+        if self.size == 0:
+            raise IndexError('empty priority queue')
+        buckets = self.buckets
+        while buckets[self.current] is None:
+            self.current += 1
+        return self.current
+
+QUEUES = {queue.name: queue for queue in (BucketQueue, HeapQueue)}
+DEFAULT_QUEUE = 'bucket'
@@ -1,135 +1,239 @@
 import maze_state as ms
-import heapq
-import tracemalloc
-from memory_profiler import memory_usage
+import maze_deadlock as md
+import maze_macro as mm
+import maze_heuristic as mh
+import maze_queue as mq
+import maze_arena as ma
+import maze_stats as mst
+import sys
 import time
+import itertools
 from abc import ABC, abstractmethod
 from collections import deque
 
 # Abstract class
 class MazeSolver(ABC):
-    def __init__(self, initial_state: ms.MazeState):
+    deterministic = True    # whether every run of a level searches the same nodes
+    # push_mode: search on pushes instead of single steps, see next_push_states
+    # normalize_player: identify states by the region ares can walk in, not by its exact cell,
+    #                   walks are then not moves any more, so this implies push_mode
+    # deadlock_detectors: names of the deadlock detectors to run, see maze_deadlock.DETECTORS
+    # macros: names of the macros that carry on a push, see maze_macro.MACROS
+    def __init__(self, initial_state: ms.MazeState, push_mode=False, normalize_player=False,
+                 deadlock_detectors=md.DEFAULT_DETECTORS, macros=mm.DEFAULT_MACROS):
         self.initial_state = initial_state
+        self.push_mode = push_mode or normalize_player
+        self.normalize_player = normalize_player
         self.compress_initial_state = ms.MazeStateCompress.from_original_maze_state(initial_state)
+        self.board = self.compress_initial_state.board
+        self.deadlock_engine = md.DeadlockEngine(self.board, deadlock_detectors)
+        self.macro_engine = mm.MacroEngine(self.board, macros)
+        # flood fills of normalized states waiting to be expanded, oldest first
+        self.reachable_cache = {}
+        self.reachable_cache_size = 100000
+        # the state the search starts from
+        self.root_state = self.compress_initial_state
+        if normalize_player:
+            self.root_state = self.normalize(self.compress_initial_state)
         self.time_consume = 0       # time consumed to solve the maze, in milliseconds (ms)
-        self.memory_consume = 0     # peak memory consumed to solve the maze, in megabytes (MB)
+        self.memory_consume = 0     # memory of the search structures at their peak, in megabytes (MB)
         self.cost = 0               # the cost, in this case, the total weight pushed along the found path
         self.state_visited = 0      # number of states explored by the algorithm
-        self.path = []              # list of states in the found path, in reverse order
+        self.stats = mst.SearchStats()  # counters of the last search, see maze_stats.SearchStats
+        self.path = []              # states of the found path, in reverse order, see maze_state.MazeReplay
         self.str_path = ''          # the string representation of the found path
+        self.cached = False         # whether the fields above come from maze_cache instead of a search
     
     @classmethod
-    def from_file(cls, file_path):
+    def from_file(cls, file_path, **options):
         maze_state = ms.MazeState.from_file(file_path)
-        return cls(maze_state)
+        return cls(maze_state, **options)
     
     @abstractmethod
     def solve_maze(self):
         pass
 
+    # solve_maze() with every allocation traced by tracemalloc, opt-in: memory_consume
+    # and stats.traced_bytes get the peak of what the search allocated, but tracing slows
+    # the search several times over, time_consume included
+    # tracemalloc is only imported here, so that importing this module stays cheap
     def solve_and_track_memory(self):
-        before = memory_usage()[0]
-        res = memory_usage(self.solve_maze, interval=0.05, retval=True, max_usage=True, max_iterations=1)
-        self.memory_consume = res[0] - before
-        return res[1]
-        
+        import tracemalloc
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            solved = self.solve_maze()
+            peak = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+        self.stats.traced_bytes = peak
+        self.memory_consume = peak / (1024 * 1024)
+        return solved
+
+    # set time_consume and the stats only known once the search is over
+    # closed_size, closed_bytes: states and bytes of the closed set,
+    # sample: an entry of the open list, to estimate its size at its peak
+    def finish_search(self, start_time, closed_size=0, closed_bytes=0, sample=None):
+        self.time_consume = (time.time() - start_time) * 1000
+        stats = self.stats
+        stats.expanded = self.state_visited
+        stats.deadlocks = sum(self.deadlock_engine.pruned.values())
+        stats.time_ms = self.time_consume
+        stats.closed_size = closed_size
+        stats.structure_bytes = closed_bytes + self.reachable_cache_bytes()
+        if sample is not None:
+            stats.structure_bytes += stats.open_peak * mst.entry_bytes(sample)
+        self.memory_consume = stats.structure_bytes / (1024 * 1024)
     
     @classmethod
-    def from_maze_state(cls, state):
-        return cls(state)
+    def from_maze_state(cls, state, **options):
+        return cls(state, **options)
     
     @classmethod
     def str_step(cls, prev_state, current_state):
         # return the character represents the step from prev_state to current_state
-        (cur_i, cur_j) = current_state.ares_position
-        (prev_i, prev_j) = prev_state.ares_position
-        if cur_i == prev_i:
-            if cur_j == prev_j - 1:
-                return 'L' if (cur_i, cur_j) in prev_state.stones_weight else 'l'
-            elif cur_j == prev_j + 1:
-                return 'R' if (cur_i, cur_j) in prev_state.stones_weight else 'r'
-        elif cur_j == prev_j:
-            if cur_i == prev_i - 1:
-                return 'U' if (cur_i, cur_j) in prev_state.stones_weight else 'u'
-            elif cur_i == prev_i + 1:
-                return 'D' if (cur_i, cur_j) in prev_state.stones_weight else 'd'
-        
-        return '?' # should not reach here
+        offset = current_state.ares - prev_state.ares
+        directions = prev_state.board.directions
+        if offset not in directions:
+            return '?' # should not reach here
+        char = 'uldr'[directions.index(offset)]
+        return char.upper() if current_state.ares in prev_state.stones else char
     
     @classmethod
     def step_cost(cls, prev_state, current_state):
         # return the cost of 1-step moving from prev_state to current_state
-        (i, j) = current_state.ares_position
-        if (i, j) not in prev_state.stones_weight:
-            return 0
-        return prev_state.stones_weight[(i, j)] 
+        return prev_state.weight_at(current_state.ares)
     
+    # yield (new_state, cost, move code) for every state reachable from state by one move
+    # a move is a single step, coded by its index in board.directions,
+    # or a whole push in push mode, coded as 4 * the cell of the pushed stone + the direction index
+    # the macros may carry a push on, the move code stays the one of the first push
+    # and the cost is the stone's weight times the number of pushes
+    def next_states(self, state: ms.MazeStateCompress):
+        if self.push_mode:
+            yield from self.next_push_states(state)
+            return
+        stones = state.stones
+        weights = self.board.stone_weights
+        directions = self.board.directions
+        macro_engine = self.macro_engine if self.macro_engine.macros else None
+        for (direction, is_push, new_state) in state.successors():
+            if not is_push:
+                yield new_state, 0, direction
+                continue
+            # a push moves ares onto the cell the stone was on
+            weight = weights[stones.index(new_state.ares)]
+            if macro_engine is None:
+                yield new_state, weight, direction
+                continue
+            (new_state, pushes) = macro_engine.extend(new_state, new_state.ares + directions[direction],
+                                                      direction)
+            yield new_state, weight * (1 + len(pushes)), direction
+
+    # in push mode a move is: walk to any cell next to a stone, then push that stone once
+    # the walk costs nothing, so a solution is the same in weight but differs in steps
+    def next_push_states(self, state: ms.MazeStateCompress):
+        neighbours = self.board.neighbours
+        stones = state.stones
+        macro_engine = self.macro_engine if self.macro_engine.macros else None
+        # a state is expanded once, so its cached flood fill is not needed afterwards
+        reachable = self.reachable_cache.pop(state, None)
+        if reachable is None:
+            reachable = state.reachable()
+        for (cell, weight) in zip(stones, self.board.stone_weights):
+            # the directions the stone has floor to go to
+            for (direction, offset, target, _) in neighbours[cell]:
+                if reachable[cell - offset] and target not in stones:
+                    new_state = state.push(cell, offset)
+                    pushes = 1
+                    if macro_engine is not None:
+                        (new_state, more) = macro_engine.extend(new_state, target, direction)
+                        pushes += len(more)
+                    if self.normalize_player:
+                        new_state = self.normalize(new_state)
+                    yield new_state, weight * pushes, 4 * cell + direction
+
+    # move ares to the top-left-most cell it can walk to,
+    # so every state with the same stones and the same ares region gets the same key
+    # the flood fill is kept for when the state is expanded
+    def normalize(self, state: ms.MazeStateCompress):
+        reachable = state.reachable()
+        new_state = state.with_ares(reachable.find(1))
+        if len(self.reachable_cache) >= self.reachable_cache_size:
+            del self.reachable_cache[next(iter(self.reachable_cache))]
+        self.reachable_cache[new_state] = reachable
+        return new_state
+
+    # a state dropped without being expanded, a duplicate or a deadlock,
+    # does not need its flood fill any more
+    def forget(self, state: ms.MazeStateCompress):
+        if self.reachable_cache:
+            self.reachable_cache.pop(state, None)
+
+    # the flood fills kept for states not expanded yet, in bytes
+    def reachable_cache_bytes(self):
+        if not self.reachable_cache:
+            return 0
+        return (sys.getsizeof(self.reachable_cache)
+                + len(self.reachable_cache) * sys.getsizeof(bytearray(self.board.size)))
+
+    # rebuild path, str_path and cost by replaying the moves from the root to node
+    def trace_back(self, arena: ma.NodeArena, node):
+        self.trace_moves(arena.moves_to(node))
+
+    # rebuild path, str_path and cost from the move codes of a whole solution
+    def trace_moves(self, moves):
+        states = self.replay_moves(moves)
+        self.str_path = ''.join(MazeSolver.str_step(prev_state, state)
+                                for (prev_state, state) in zip(states, states[1:]))
+        self.path = ms.MazeReplay(self.initial_state, self.str_path)
+        self.cost = sum(MazeSolver.step_cost(prev_state, state)
+                        for (prev_state, state) in zip(states, states[1:]))
+
+    # the single step states ares walks through when making the given moves
+    # in push mode ares walks to every push along a shortest path, starting from
+    # its real position, not from the normalized root state
+    # a push is followed by the pushes the macros make after it, as in the search
+    def replay_moves(self, moves):
+        directions = self.board.directions
+        steps = [self.compress_initial_state]
+        for move in moves:
+            if not self.push_mode:
+                direction = move
+                state = steps[-1]
+                steps.append(state.move(directions[direction]))
+                if steps[-1].ares not in state.stones:
+                    continue
+                stone = steps[-1].ares + directions[direction]
+            else:
+                (stone, direction) = divmod(move, 4)
+                offset = directions[direction]
+                for walk in steps[-1].walk_path(stone - offset):
+                    steps.append(steps[-1].move(walk))
+                steps.append(steps[-1].move(offset))
+                stone += offset
+            (_, pushes) = self.macro_engine.extend(steps[-1], stone, direction)
+            for (stone, offset) in pushes:
+                for walk in steps[-1].walk_path(stone - offset):
+                    steps.append(steps[-1].move(walk))
+                steps.append(steps[-1].move(offset))
+        return steps
+
     # a state is deadlock if one or more stones 
     # are not on switches and cannot be moved by Ares
-    # see deadlock patterns in deadlock_patterns.txt
+    # see maze_deadlock.py and the deadlock patterns in deadlock_patterns.txt
     def is_deadlock(self, compress_state: ms.MazeStateCompress):
-        for (i, j) in compress_state.stones_weight:
-            if (i, j) in compress_state.switches_position:
-                continue
-            # pattern 1
-            positions = [(-1, 0), (0, -1), (1, 0), (0, 1), (-1, 0)]
-            for _ in range(0, 4):
-                di_1, dj_1 = positions[_]
-                di_2, dj_2 = positions[_ + 1]
-                if (self.initial_state.grid[i + di_1][j + dj_1] == '#' 
-                    and self.initial_state.grid[i + di_2][j +dj_2] == '#'):
-                    return True
-            
-            # pattern 2
-            positions = [(-1, 0), (-1,-1), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0)]
-            for _ in range(0, 7, 2):
-                di_1, dj_1 = positions[_]
-                di_2, dj_2 = positions[_ + 1]
-                di_3, dj_3 = positions[_ + 2]
-                if (
-                    (self.initial_state.grid[i + di_1][j + dj_1] == '#' 
-                    or (i + di_1, j + dj_1) in compress_state.stones_weight)
-                    and 
-                    (self.initial_state.grid[i + di_2][j + dj_2] == '#' 
-                    or (i + di_2, j + dj_2) in compress_state.stones_weight)
-                    and 
-                    (self.initial_state.grid[i + di_3][j + dj_3] == '#' 
-                    or (i + di_3, j + dj_3) in compress_state.stones_weight)
-                   ):
-                    return True
-                
-            # pattern 3
-            for (di_1, dj_1, di_2, dj_2, di_3, dj_3) in ((1, 1, 0, 1, -1, 0), 
-                                                         (-1, 1, -1, 0, 0, -1),
-                                                         (-1, -1, 0, -1, 1, 0),
-                                                         (1, -1, 1, 0, 0, 1),
-                                                         (0, 1, -1, 0, -1, -1),
-                                                         (-1, 0, 0, -1, 1, -1),
-                                                         (0, -1, 1, 0, 1, 1),
-                                                         (1, 0, 0, 1, -1, 1)):
-                if (self.initial_state.grid[i + di_1][j + dj_1] == '#'
-                    and (i + di_2, j + dj_2) in compress_state.stones_weight
-                    and self.initial_state.grid[i + di_3][j + dj_3] == '#'):
-                    return True
-            
-            # pattern 4
-            for (di_1, dj_1, di_2, dj_2, di_3, dj_3, di_4, dj_4) in ((1, 1, 0, 1, -1, 0, -1, -1),
-                                                                     (-1, 1, -1, 0, 0, -1, 1, -1),
-                                                                     (-1, -1, 0, -1, 1, 0, 1, 1),
-                                                                     (1, -1, 1, 0, 0, 1, -1, 1)):
-                if ((i + di_2, j + dj_2) in compress_state.stones_weight
-                    and (i + di_3, j + dj_3) in compress_state.stones_weight
-                    and self.initial_state.grid[i + di_1][j + dj_1] == '#'
-                    and self.initial_state.grid[i + di_4][j + dj_4] == '#'):
-                    return True
-                 
-        return False
+        return self.deadlock_engine.is_deadlock(compress_state)
     
 
 # MazeSolver class using BFS algorithm
 class MazeSolverBFS(MazeSolver):
-    def __init__(self, initial_state):
-        super().__init__(initial_state)
+    def __init__(self, initial_state, **options):
+        super().__init__(initial_state, **options)
     
     def solve_maze(self):
         start_time = time.time()
@@ -137,53 +241,57 @@ class MazeSolverBFS(MazeSolver):
         self.path = []
         self.str_path = ''
         self.state_visited = 1
+        self.deadlock_engine.reset()
+        self.stats = mst.SearchStats()
 
         if self.initial_state.is_goal_state():
-            self.path = [self.initial_state]
-            self.time_consume = (time.time() - start_time) * 1000
+            self.path = ms.MazeReplay(self.initial_state, '')
+            self.finish_search(start_time)
             return True
 
-        trace = {self.compress_initial_state: None}
-        visited = {self.compress_initial_state}
+        # reached states, the queue keeps only the ones not expanded yet
+        arena = ma.NodeArena()
+        arena.add(self.root_state, -1, -1, 0)
         q = deque()
-        q.append(self.compress_initial_state)
-
-        def trace_back(state: ms.MazeStateCompress):
-            while state in trace:
-                self.path.append(state.decompress(self.initial_state))
-                if trace[state] != None:
-                    self.str_path = MazeSolver.str_step(trace[state], state) + self.str_path
-                    self.cost = self.cost + MazeSolver.step_cost(trace[state], state)
-                state = trace[state]
-        
+        q.append(self.root_state)
+
+        stats = self.stats
         while q:
             state = q.popleft()
             if self.is_deadlock(state):
+                self.forget(state)
                 continue
-            for (check, move) in [(state.can_move_up, state.move_up), 
-                                  (state.can_move_left, state.move_left), 
-                                  (state.can_move_down, state.move_down), 
-                                  (state.can_move_right, state.move_right)]:
-                if not check(self.initial_state):
-                    continue
-                new_state = move()
-                if new_state not in visited:
+            node = arena.node(state)
+            cost = arena.costs[node]
+            for (new_state, step_cost, move) in self.next_states(state):
+                stats.generated += 1
+                if new_state not in arena:
                     self.state_visited += 1
-                    trace[new_state] = state
+                    new_node = arena.add(new_state, node, move, cost + step_cost)
                     if new_state.is_goal_state():
-                        trace_back(new_state)
-                        self.time_consume = (time.time() - start_time) * 1000
+                        self.trace_back(arena, new_node)
+                        self.finish_search(start_time, len(arena), arena.nbytes(), state)
                         return True
-                    visited.add(new_state)
                     q.append(new_state)
+                else:
+                    stats.duplicates += 1
+                    self.forget(new_state)
+            if len(q) > stats.open_peak:
+                stats.open_peak = len(q)
 
-        self.time_consume = (time.time() - start_time) * 1000
+        self.finish_search(start_time, len(arena), arena.nbytes(), self.root_state)
         return False
 
 # MazeSolver class using DFS algorithm
 class MazeSolverDFS(MazeSolver):
-    def __init__(self, initial_state):
-        super().__init__(initial_state)
+    # in_place: search on one MazeState changed with make/unmake, see solve_in_place
+    def __init__(self, initial_state, in_place=False, **options):
+        super().__init__(initial_state, **options)
+        if in_place and self.push_mode:
+            raise ValueError("In place DFS moves one step at a time, it cannot use push_mode")
+        if in_place and self.macro_engine.macros:
+            raise ValueError("In place DFS moves one step at a time, it cannot use macros")
+        self.in_place = in_place
     
     def solve_maze(self):
         start_time = time.time()
@@ -191,53 +299,115 @@ class MazeSolverDFS(MazeSolver):
         self.path = []
         self.str_path = ''
         self.state_visited = 1
+        self.deadlock_engine.reset()
+        self.stats = mst.SearchStats()
 
         if self.initial_state.is_goal_state():
-            self.path = [self.initial_state]
-            self.time_consume = (time.time() - start_time) * 1000
+            self.path = ms.MazeReplay(self.initial_state, '')
+            self.finish_search(start_time)
             return True
+
+        if self.in_place:
+            return self.solve_in_place(start_time)
         
-        trace = {self.compress_initial_state: None}
-        visited = {self.compress_initial_state}
+        # reached states, the queue keeps only the ones not expanded yet
+        arena = ma.NodeArena()
+        arena.add(self.root_state, -1, -1, 0)
         q = deque()
-        q.append(self.compress_initial_state)
-
-        def trace_back(state: ms.MazeStateCompress):
-            while state in trace:
-                self.path.append(state.decompress(self.initial_state))
-                if trace[state] != None:
-                    self.str_path = MazeSolver.str_step(trace[state], state) + self.str_path
-                    self.cost = self.cost + MazeSolver.step_cost(trace[state], state)
-                state = trace[state]
-        
+        q.append(self.root_state)
+
+        stats = self.stats
         while q:
             state = q.pop()
             if self.is_deadlock(state):
+                self.forget(state)
                 continue
-            for (check, move) in [(state.can_move_up, state.move_up), 
-                                  (state.can_move_left, state.move_left), 
-                                  (state.can_move_down, state.move_down), 
-                                  (state.can_move_right, state.move_right)]:
-                if not check(self.initial_state):
-                    continue
-                new_state = move()
-                if new_state not in visited:
+            node = arena.node(state)
+            cost = arena.costs[node]
+            for (new_state, step_cost, move) in self.next_states(state):
+                stats.generated += 1
+                if new_state not in arena:
                     self.state_visited += 1
-                    trace[new_state] = state
+                    new_node = arena.add(new_state, node, move, cost + step_cost)
                     if new_state.is_goal_state():
-                        trace_back(new_state)
-                        self.time_consume = (time.time() - start_time) * 1000
+                        self.trace_back(arena, new_node)
+                        self.finish_search(start_time, len(arena), arena.nbytes(), state)
                         return True
-                    visited.add(new_state)
                     q.append(new_state)
+                else:
+                    stats.duplicates += 1
+                    self.forget(new_state)
+            if len(q) > stats.open_peak:
+                stats.open_peak = len(q)
 
-        self.time_consume = (time.time() - start_time) * 1000
+        self.finish_search(start_time, len(arena), arena.nbytes(), self.root_state)
+        return False
+
+    # depth-first search with a single live MazeState: a move is made on it when the search
+    # goes down and unmade when it comes back, so apart from the reached states' hashes in
+    # the arena, memory only grows with the depth, by one frame and one undo record per step
+    # the hash is kept up to date along with the moves, as MazeStateCompress.move would
+    # deadlocks are only looked for after a push, a walk keeps the stones and ares's region
+    def solve_in_place(self, start_time):
+        board = self.board
+        ares_keys = board.ares_keys
+        state = ms.MazeState.from_other_maze_state(self.initial_state)
+        arena = ma.NodeArena()
+        root = arena.add_hash(self.root_state.zobrist, -1, -1, 0)
+        # a frame per state on the current line: its node, its hash, the next direction
+        # to try and the undo record of the move that led to it
+        stack = [[root, self.root_state.zobrist, 0, None]]
+        stats = self.stats
+        while stack:
+            frame = stack[-1]
+            (node, zobrist, direction, undo) = frame
+            if direction == len(ms.MazeState.directions):
+                stack.pop()
+                if undo is not None:
+                    state.unmake(undo)
+                continue
+            frame[2] += 1
+            new_undo = state.make(*ms.MazeState.directions[direction])
+            if new_undo is None:
+                continue
+            stats.generated += 1
+            (i, j, di, dj, pushed, weight) = new_undo
+            target = board.index(i + di, j + dj)
+            new_zobrist = zobrist ^ ares_keys[board.index(i, j)] ^ ares_keys[target]
+            if pushed:
+                keys = board.class_keys[weight]
+                new_zobrist ^= keys[target] ^ keys[target + board.directions[direction]]
+            if arena.find(new_zobrist) != -1:
+                stats.duplicates += 1
+                state.unmake(new_undo)
+                continue
+            self.state_visited += 1
+            new_node = arena.add_hash(new_zobrist, node, direction, arena.costs[node] + weight)
+            if pushed:
+                if state.is_goal_state():
+                    self.trace_back(arena, new_node)
+                    self.finish_search(start_time, len(arena), arena.nbytes())
+                    return True
+                compress_state = ms.MazeStateCompress(board, target, board.pack_stones(state.stones_weight),
+                                                      new_zobrist)
+                if self.is_deadlock(compress_state):
+                    state.unmake(new_undo)
+                    continue
+            stack.append([new_node, new_zobrist, 0, new_undo])
+            if len(stack) > stats.open_peak:
+                stats.open_peak = len(stack)
+
+        self.finish_search(start_time, len(arena), arena.nbytes())
         return False
 
 # MazeSolver class using UCS algorithm
 class MazeSolverUCS(MazeSolver):
-    def __init__(self, initial_state):
-        super().__init__(initial_state)
+    # queue: name of the priority queue, see maze_queue.QUEUES
+    def __init__(self, initial_state, queue=mq.DEFAULT_QUEUE, **options):
+        super().__init__(initial_state, **options)
+        if queue not in mq.QUEUES:
+            raise ValueError(f"Unknown priority queue: {queue}")
+        self.queue = queue
     
     def solve_maze(self):
         start_time = time.time()
@@ -245,94 +415,74 @@ class MazeSolverUCS(MazeSolver):
         self.path = []
         self.str_path = ''
         self.state_visited = 0
+        self.deadlock_engine.reset()
+        self.stats = mst.SearchStats()
 
-        trace = {}
-        visited = set()
-        pq = []
-
-        def trace_back(state: ms.MazeStateCompress):
-            while state in trace:
-                self.path.append(state.decompress(self.initial_state))
-                if trace[state] != None:
-                    self.str_path = MazeSolver.str_step(trace[state], state) + self.str_path
-                    self.cost = self.cost + MazeSolver.step_cost(trace[state], state)
-                state = trace[state]
-        
-        class HeapNode:
-            def __init__(self, cost, step, current_state, prev_state):
-                self.cost = cost
-                self.step = step
-                self.current_state = current_state
-                self.prev_state = prev_state
-
-            def __lt__(self, other):
-                if self.cost == other.cost:
-                    return self.step < other.step
-                return self.cost < other.cost
+        # expanded states, queue entries point to their parent by its node
+        arena = ma.NodeArena()
+        # ordered by cost, then by steps
+        pq = mq.QUEUES[self.queue]()
         
-        heapq.heappush(pq, HeapNode(0, 0, self.compress_initial_state, None))
+        entry = (0, 0, self.root_state, -1, -1)
+        pq.push(0, 0, entry)
+        stats = self.stats
         while pq:
-            heap_node = heapq.heappop(pq)
-            cost = heap_node.cost
-            step = heap_node.step
-            state = heap_node.current_state
-            prev_state = heap_node.prev_state
+            entry = pq.pop()
+            (cost, step, state, parent, move) = entry
 
-            if state in visited:
+            if state in arena:
+                stats.duplicates += 1
                 continue
 
             self.state_visited += 1
 
             if self.is_deadlock(state):
+                self.forget(state)
                 continue
 
-            trace[state] = prev_state
-            visited.add(state)
+            node = arena.add(state, parent, move, cost)
 
             if state.is_goal_state():
-                trace_back(state)
-                self.time_consume = (time.time() - start_time) * 1000
+                self.trace_back(arena, node)
+                self.finish_search(start_time, len(arena), arena.nbytes(), entry)
                 return True
 
-            for (check, move) in [(state.can_move_up, state.move_up), 
-                                  (state.can_move_left, state.move_left), 
-                                  (state.can_move_down, state.move_down), 
-                                  (state.can_move_right, state.move_right)]:
-                if not check(self.initial_state):
-                    continue
-                new_state = move()
-                if new_state not in visited:
-                    (i, j) = new_state.ares_position
-                    heapq.heappush(pq, 
-                                   HeapNode(cost + MazeSolver.step_cost(state, new_state), 
-                                            step + 1, new_state, state))
-
-        self.time_consume = (time.time() - start_time) * 1000
+            for (new_state, step_cost, move) in self.next_states(state):
+                stats.generated += 1
+                if new_state not in arena:
+                    pq.push(cost + step_cost, step + 1,
+                            (cost + step_cost, step + 1, new_state, node, move))
+                else:
+                    stats.duplicates += 1
+                    self.forget(new_state)
+            if len(pq) > stats.open_peak:
+                stats.open_peak = len(pq)
+
+        self.finish_search(start_time, len(arena), arena.nbytes(), entry)
         return False
     
 # MazeSolver class using A* algorithm
 class MazeSolverAStar(MazeSolver):
-    def __init__(self, initial_state):
-        super().__init__(initial_state)
-
-    def heuristic_value(self, state):
-        # sum of distance from each stone to the closest switch, multiply the weight of the stone
-        hcost = 0
-        for (i, j) in state.stones_weight:
-            min_distance = 2000000000
-            for (x, y) in self.initial_state.switches_position:
-                distance = abs(i - x) + abs(j - y)
-                min_distance = min(min_distance, distance)
-            hcost += min_distance * state.stones_weight[(i, j)]
-        
-        # distance from Ares to the closest stone
-        (x, y) = state.ares_position
+    # heuristic: name of the lower bound on the weight still to push, see maze_heuristic.HEURISTICS
+    # queue: name of the priority queue, see maze_queue.QUEUES
+    def __init__(self, initial_state, heuristic='matching', queue=mq.DEFAULT_QUEUE, **options):
+        super().__init__(initial_state, **options)
+        if heuristic not in mh.HEURISTICS:
+            raise ValueError(f"Unknown heuristic: {heuristic}")
+        if queue not in mq.QUEUES:
+            raise ValueError(f"Unknown priority queue: {queue}")
+        self.heuristic = mh.HEURISTICS[heuristic](self.board)
+        self.queue = queue
+
+    # distance from Ares to the closest stone, to break ties between equal costs
+    def hstep(self, state):
+        (x, y) = self.board.position(state.ares)
         hstep = 2000000000
-        for (i, j) in state.stones_weight:
+        for cell in state.stones:
+            (i, j) = self.board.position(cell)
             distance = abs(i - x) + abs(j - y)
-            hstep = min(min_distance, distance)
-
-        return hcost, hstep
+            hstep = min(hstep, distance)
+        return hstep
     
     def solve_maze(self):
         start_time = time.time()
@@ -340,74 +490,361 @@ class MazeSolverAStar(MazeSolver):
         self.path = []
         self.str_path = ''
         self.state_visited = 0
-
-        trace = {}
-        visited = set()
-        pq = []
-
-        def trace_back(state: ms.MazeStateCompress):
-            while state in trace:
-                self.path.append(state.decompress(self.initial_state))
-                if trace[state] != None:
-                    self.str_path = MazeSolver.str_step(trace[state], state) + self.str_path
-                    self.cost = self.cost + MazeSolver.step_cost(trace[state], state)
-                state = trace[state]
-        
-        class HeapNode:
-            def __init__(self, heuristic_value, cost, step, current_state, prev_state):
-                self.heuristic_value = heuristic_value
-                self.cost = cost
-                self.step = step 
-                self.current_state = current_state
-                self.prev_state = prev_state
-
-            def __lt__(self, other):
-                self_cost = self.heuristic_value[0] + self.cost
-                other_cost = other.heuristic_value[0] + other.cost
-                if self_cost == other_cost: # same hcost
-                    return self.heuristic_value[1] + self.step < other.heuristic_value[1] + other.step
-                return self_cost < other_cost
+        self.deadlock_engine.reset()
+        self.stats = mst.SearchStats()
+
+        # expanded states, queue entries point to their parent by its node
+        arena = ma.NodeArena()
+        # ordered by cost plus hcost, then by steps plus hstep
+        # the heuristic record of a state rides along with it, so that its successors
+        # get theirs by updating it instead of evaluating the heuristic from scratch
+        pq = mq.QUEUES[self.queue]()
         
-        heapq.heappush(pq, HeapNode(self.heuristic_value(self.compress_initial_state),
-                                    0, 0, self.compress_initial_state, None))
+        record = self.heuristic.evaluate(self.root_state.stones)
+        entry = (0, 0, self.root_state, -1, -1, record)
+        if record is not None:
+            pq.push(self.heuristic.cost(record), self.hstep(self.root_state), entry)
+        stats = self.stats
         while pq:
-            heap_node = heapq.heappop(pq)
-            cost = heap_node.cost
-            step = heap_node.step
-            state = heap_node.current_state
-            prev_state = heap_node.prev_state
+            entry = pq.pop()
+            (cost, step, state, parent, move, parent_record) = entry
 
-            if state in visited:
+            if state in arena:
+                stats.duplicates += 1
                 continue
 
             self.state_visited += 1
 
             if self.is_deadlock(state):
+                self.forget(state)
                 continue
 
-            trace[state] = prev_state
-            visited.add(state)
+            node = arena.add(state, parent, move, cost)
 
             if state.is_goal_state():
-                trace_back(state)
-                self.time_consume = (time.time() - start_time) * 1000
+                self.trace_back(arena, node)
+                self.finish_search(start_time, len(arena), arena.nbytes(), entry)
                 return True
 
-            for (check, move) in [(state.can_move_up, state.move_up), 
-                                  (state.can_move_left, state.move_left), 
-                                  (state.can_move_down, state.move_down), 
-                                  (state.can_move_right, state.move_right)]:
-                if not check(self.initial_state):
+            for (new_state, step_cost, move) in self.next_states(state):
+                stats.generated += 1
+                if new_state in arena:
+                    stats.duplicates += 1
+                    self.forget(new_state)
+                else:
+                    # a walk keeps the record, a push only updates the moved stone
+                    record = self.heuristic.update(parent_record, state.stones, new_state.stones)
+                    if record is None:
+                        self.forget(new_state)
+                        continue
+                    pq.push(cost + step_cost + self.heuristic.cost(record),
+                            step + 1 + self.hstep(new_state),
+                            (cost + step_cost, step + 1, new_state, node, move, record))
+            if len(pq) > stats.open_peak:
+                stats.open_peak = len(pq)
+
+        self.finish_search(start_time, len(arena), arena.nbytes(), entry)
+        return False
+    
+
+# MazeSolver class searching from both ends at once
+# a forward search pushes stones from the initial state, a backward search pulls them
+# from every goal configuration: each way to put the stones on the switches, with ares
+# in each region it can be left in; the two meet on a state both have reached
+# both sides are uniform cost searches on the weight pushed, and stop once the smallest
+# costs in their queues add up to the cheapest meeting found, so the cost is optimal
+# states are normalized as with normalize_player, which this solver always uses
+class MazeSolverBidirectional(MazeSolver):
+    # queue: name of the priority queue, see maze_queue.QUEUES
+    def __init__(self, initial_state, queue=mq.DEFAULT_QUEUE, **options):
+        options['normalize_player'] = True
+        super().__init__(initial_state, **options)
+        if queue not in mq.QUEUES:
+            raise ValueError(f"Unknown priority queue: {queue}")
+        # a pull cannot undo a macro's run of pushes in one move
+        if self.macro_engine.macros:
+            raise ValueError("Bidirectional search cannot use macros")
+        self.queue = queue
+        self.stone_cells = self.find_stone_cells()
+
+    # cells a stone can be pushed to from its initial cell, alone on the board
+    # the backward search never pulls a stone anywhere else
+    def find_stone_cells(self):
+        walls = self.board.walls
+        stone_cells = bytearray(self.board.size)
+        stack = list(self.compress_initial_state.stones)
+        for cell in stack:
+            stone_cells[cell] = 1
+        while stack:
+            cell = stack.pop()
+            for offset in self.board.directions:
+                if (not stone_cells[cell + offset]
+                    and not walls[cell + offset]
+                    and not walls[cell - offset]):
+                    stone_cells[cell + offset] = 1
+                    stack.append(cell + offset)
+        return stone_cells
+
+    # every stone tuple with all the stones on switches
+    # stones of the same weight are interchangeable, so each weight group, in slot order,
+    # takes a combination of the switches the groups before it left free
+    def goal_stones(self):
+        board = self.board
+        layouts = [()]
+        for (start, end) in sorted(set(board.weight_groups)):
+            layouts = [layout + cells for layout in layouts
+                       for cells in itertools.combinations(sorted(board.switches - set(layout)),
+                                                           end - start)]
+        return layouts
+
+    # every normalized state with all the stones on switches
+    def goal_states(self):
+        board = self.board
+        goals = set()
+        for stones in self.goal_stones():
+            # one state per region ares can be in
+            covered = bytearray(board.size)
+            for cell in range(0, board.size):
+                if not board.interior[cell] or cell in stones or covered[cell]:
                     continue
-                new_state = move()
-                if new_state not in visited:
-                    heapq.heappush(pq, 
-                                   HeapNode(self.heuristic_value(new_state), 
-                                            cost + MazeSolver.step_cost(state, new_state),
-                                            step + 1,
-                                            new_state, state))
+                state = ms.MazeStateCompress(board, cell, stones)
+                reachable = state.reachable()
+                covered = bytearray(a | b for (a, b) in zip(covered, reachable))
+                goals.add(state)
+        return goals
+
+    # yield (new_state, weight, move code) for every state that leads to state by one push
+    # a pull moves the stone on cell by offset, and ares from cell + offset to cell + 2 * offset
+    # the move code is the one of the push back, as in next_states
+    def next_pull_states(self, state: ms.MazeStateCompress):
+        neighbours = self.board.neighbours
+        stones = state.stones
+        reachable = self.reachable_cache.pop(state, None)
+        if reachable is None:
+            reachable = state.reachable()
+        for (cell, weight) in zip(stones, self.board.stone_weights):
+            # ares steps back from target to push_to, pulling the stone to target
+            for (direction, offset, target, push_to) in neighbours[cell]:
+                if (push_to != -1
+                    and reachable[target]
+                    and push_to not in stones
+                    and self.stone_cells[target]):
+                    new_state = self.normalize(state.push(cell, offset).with_ares(push_to))
+                    # the push back goes the opposite way, direction + 2 in (up, left, down, right)
+                    yield new_state, weight, 4 * target + (direction + 2) % 4
 
-        self.time_consume = (time.time() - start_time) * 1000
+    def solve_maze(self):
+        start_time = time.time()
+        self.cost = 0
+        self.path = []
+        self.str_path = ''
+        self.state_visited = 0
+        self.deadlock_engine.reset()
+        self.stats = mst.SearchStats()
+
+        if self.initial_state.is_goal_state():
+            self.path = ms.MazeReplay(self.initial_state, '')
+            self.finish_search(start_time)
+            return True
+
+        # expanded states of each side, ordered by cost then by pushes
+        forward = ma.NodeArena()
+        backward = ma.NodeArena()
+        forward_pq = mq.QUEUES[self.queue]()
+        backward_pq = mq.QUEUES[self.queue]()
+        forward_pq.push(0, 0, (0, 0, self.root_state, -1, -1))
+        for goal in self.goal_states():
+            backward_pq.push(0, 0, (0, 0, goal, -1, -1))
+
+        # the cheapest meeting so far: (cost, forward node, push, backward node)
+        # the push leads from the forward node to the state of the backward node,
+        # or straight to a goal if the backward node is None
+        best = None
+        entry = None
+        stats = self.stats
+        while forward_pq or backward_pq:
+            # a side with an empty queue has nothing cheaper left to find
+            forward_min = forward_pq.min_key() if forward_pq else mh.INF
+            backward_min = backward_pq.min_key() if backward_pq else mh.INF
+            if best is not None and forward_min + backward_min >= best[0]:
+                break
+
+            # expand the side with the smaller queue, or the only one left
+            is_forward = (bool(forward_pq)
+                          and (not backward_pq or len(forward_pq) <= len(backward_pq)))
+            (arena, other, pq) = ((forward, backward, forward_pq) if is_forward
+                                  else (backward, forward, backward_pq))
+            entry = pq.pop()
+            (cost, step, state, parent, move) = entry
+
+            if state in arena:
+                stats.duplicates += 1
+                continue
+
+            self.state_visited += 1
+
+            if is_forward and self.is_deadlock(state):
+                self.forget(state)
+                continue
+
+            node = arena.add(state, parent, move, cost)
+            successors = self.next_states(state) if is_forward else self.next_pull_states(state)
+            for (new_state, step_cost, move) in successors:
+                stats.generated += 1
+                # the goals wait in the backward queue and may never be expanded,
+                # so the forward side meets them on its own
+                if is_forward and new_state.is_goal_state():
+                    if best is None or cost + step_cost < best[0]:
+                        best = (cost + step_cost, node, move, None)
+                other_node = other.node(new_state)
+                if other_node is not None:
+                    total = cost + step_cost + other.costs[other_node]
+                    if best is None or total < best[0]:
+                        best = ((total, node, move, other_node) if is_forward
+                                else (total, other_node, move, node))
+                if new_state not in arena:
+                    pq.push(cost + step_cost, step + 1,
+                            (cost + step_cost, step + 1, new_state, node, move))
+                else:
+                    stats.duplicates += 1
+                    self.forget(new_state)
+            if len(forward_pq) + len(backward_pq) > stats.open_peak:
+                stats.open_peak = len(forward_pq) + len(backward_pq)
+
+        closed_size = len(forward) + len(backward)
+        closed_bytes = forward.nbytes() + backward.nbytes()
+        if best is None:
+            self.finish_search(start_time, closed_size, closed_bytes, entry)
+            return False
+
+        # forward moves to the meeting, then the pushes undoing the pulls back to a goal
+        (_, node, move, back_node) = best
+        moves = forward.moves_to(node) + [move]
+        while back_node is not None and backward.parents[back_node] != -1:
+            moves.append(backward.moves[back_node])
+            back_node = backward.parents[back_node]
+        self.trace_moves(moves)
+        self.finish_search(start_time, closed_size, closed_bytes, entry)
+        return True
+    
+
+# MazeSolver class using iterative deepening A*
+# depth-first searches on pushes, each one cut at a bound on cost plus hcost that grows
+# to the smallest value the previous one went past, so the first solution found is optimal
+# memory does not grow with the number of states: only the current line of pushes and a
+# transposition table of tt_size slots, see maze_arena.TranspositionTable, are kept
+# states are normalized as with normalize_player, which this solver always uses
+class MazeSolverIDAStar(MazeSolver):
+    # heuristic: name of the lower bound on the weight still to push, see maze_heuristic.HEURISTICS
+    # tt_size: slots of the transposition table, rounded up to a power of 2
+    def __init__(self, initial_state, heuristic='matching', tt_size=1 << 20, **options):
+        options['normalize_player'] = True
+        super().__init__(initial_state, **options)
+        if heuristic not in mh.HEURISTICS:
+            raise ValueError(f"Unknown heuristic: {heuristic}")
+        self.heuristic = mh.HEURISTICS[heuristic](self.board)
+        self.tt_size = tt_size
+        # most states generated are cut by the bound and never expanded,
+        # only the flood fills of the latest ones are worth keeping
+        self.reachable_cache_size = 4096
+        self.iterations = 0         # depth-first searches run by the last solve_maze
+
+    # (cost plus hcost, cost, new_state, record, move code) for every successor of state,
+    # cheapest first, hcost is raised to what the table has learned about new_state
+    def children(self, table: ma.TranspositionTable, state, cost, record):
+        children = []
+        for (new_state, step_cost, move) in self.next_states(state):
+            self.stats.generated += 1
+            new_record = self.heuristic.update(record, state.stones, new_state.stones)
+            if new_record is None:
+                continue
+            new_cost = cost + step_cost
+            hcost = max(self.heuristic.cost(new_record), table.bound(new_state.zobrist))
+            children.append((new_cost + hcost, new_cost, new_state, new_record, move))
+        children.sort(key=lambda child: child[0])
+        return children
+
+    # depth-first search of the states with cost plus hcost within bound
+    # returns the moves of a solution and None, or None and the smallest cost plus hcost
+    # past the bound, which is None as well if nothing went past it
+    def bounded_search(self, table: ma.TranspositionTable, bound, record, age):
+        next_bound = None
+        table.store(self.root_state.zobrist, 0, age)
+        # a frame per state on the current line of pushes: the children left to try,
+        # the state's hash and cost, and the smallest cost plus hcost found below it,
+        # which is a lower bound for the state once all its children are done
+        stack = [[iter(self.children(table, self.root_state, 0, record)),
+                  self.root_state.zobrist, 0, mh.INF]]
+        moves = []
+        while stack:
+            frame = stack[-1]
+            child = next(frame[0], None)
+            if child is None:
+                stack.pop()
+                (_, zobrist, cost, lowest) = frame
+                table.learn(zobrist, min(lowest - cost, mh.INF))
+                if stack:
+                    moves.pop()
+                    stack[-1][3] = min(stack[-1][3], lowest)
+                continue
+            (f, cost, state, record, move) = child
+            if f > bound:
+                # the children are sorted, the rest of them are past the bound too
+                if next_bound is None or f < next_bound:
+                    next_bound = f
+                frame[3] = min(frame[3], f)
+                frame[0] = iter(())
+                continue
+            if state.is_goal_state():
+                return moves + [move], None
+            if table.seen(state.zobrist, cost, age):
+                self.stats.duplicates += 1
+                self.forget(state)
+                frame[3] = min(frame[3], f)
+                continue
+            table.store(state.zobrist, cost, age)
+
+            self.state_visited += 1
+
+            if self.is_deadlock(state):
+                table.learn(state.zobrist, mh.INF)
+                self.forget(state)
+                continue
+
+            stack.append([iter(self.children(table, state, cost, record)), state.zobrist, cost, mh.INF])
+            moves.append(move)
+            # the open list of a depth-first search is its stack
+            if len(stack) > self.stats.open_peak:
+                self.stats.open_peak = len(stack)
+        return None, next_bound
+
+    def solve_maze(self):
+        start_time = time.time()
+        self.cost = 0
+        self.path = []
+        self.str_path = ''
+        self.state_visited = 1
+        self.iterations = 0
+        self.deadlock_engine.reset()
+        self.stats = mst.SearchStats()
+
+        if self.initial_state.is_goal_state():
+            self.path = ms.MazeReplay(self.initial_state, '')
+            self.finish_search(start_time)
+            return True
+
+        record = self.heuristic.evaluate(self.root_state.stones)
+        bound = None if record is None else self.heuristic.cost(record)
+        table = ma.TranspositionTable(self.tt_size)
+        while bound is not None:
+            self.iterations += 1
+            (moves, bound) = self.bounded_search(table, bound, record, self.iterations)
+            if moves is not None:
+                self.trace_moves(moves)
+                self.finish_search(start_time, table.used(), table.nbytes())
+                return True
+
+        self.finish_search(start_time, table.used(), table.nbytes())
         return False
     
 
@@ -422,37 +859,9 @@ def check(maze_solver: MazeSolver):
     print("step: ", len(maze_solver.path) - 1)
     print("mem use: ", maze_solver.memory_consume)
     print("time: ", maze_solver.time_consume)
+    print("deadlock pruned: ", maze_solver.deadlock_engine.pruned)
     print(maze_solver.str_path)
 
-# temp = ms.MazeState(None, None, None, None, None, None)
-bfs = MazeSolverBFS.from_file('input-08.txt')
-dfs = MazeSolverDFS.from_file('input-08.txt')
-ucs = MazeSolverUCS.from_file('input-08.txt')
-a_star = MazeSolverAStar.from_file('input-01.txt') 
-
-# start_time = time.time()
-# check(dfs)
-# end_time = time.time()
-# elapsed_time = end_time - start_time
-# print(f"Elapsed time: {(elapsed_time * 1000):.4f} ms")
-
-# start_time = time.time()
-# check(ucs)
-# end_time = time.time()
-# elapsed_time = end_time - start_time
-# print(f"Elapsed time: {(elapsed_time * 1000):.4f} ms")
-
-# check(a_star)
-
-
-#check(dfs)
-#check(ucs)
-
-
-
-
-
-
-    
-
-        
\ No newline at end of file
+if __name__ == '__main__':
+    # python maze_solver.py input-08.txt
+    check(MazeSolverAStar.from_file(sys.argv[1] if len(sys.argv) > 1 else 'input-01.txt'))
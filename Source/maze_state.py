@@ -1,4 +1,7 @@
 import copy 
+import random
+import re
+from collections import deque
 
 class MazeState:
     def __init__(self, 
@@ -18,46 +21,59 @@ class MazeState:
     @classmethod
     def from_file(cls, file_path):
         with open(file_path, 'r', encoding='utf-8') as file:
-            weights = list(map(int,file.readline().split(' ')))
-            grid = []
-            lines = file.readlines()
-            height = len(lines)
-            width = 0
-            for line in lines:
-                chars = list(line.rstrip('\n'))
-                grid.append(chars)
-                width = max(width, len(chars))
+            return cls.from_lines(file.readlines())
+
+    # lines of a maze file: the stone weights, then the rows of the maze
+    # an empty weights line means every stone weighs 1
+    @classmethod
+    def from_lines(cls, lines):
+        weights = list(map(int, lines[0].split())) if lines[0].strip() else None
+        return cls.from_rows(weights, [line.rstrip('\n') for line in lines[1:]])
+
+    # the maze of the given rows, weights of the stones in reading order, None for all 1
+    # raises ValueError if the maze has no Ares or not as many stones as weights
+    @classmethod
+    def from_rows(cls, weights, rows):
+        height = len(rows)
+        width = max(map(len, rows), default=0)
+        # ragged rows are padded with floor, the board marks it as wall if it is outside
+        grid = [list(row.ljust(width)) for row in rows]
 
         ares_position = None
-        weights_index = 0
-        stones_weight = {}
+        stones = []
         switches_position = []
-        for i in range(0, len(grid)):
-            for j in range(0, len(grid[i])):
-                if grid[i][j] == '@':
-                    ares_position = (i, j)
-                elif grid[i][j] == '$':
-                    stones_weight[(i, j)] = weights[weights_index]
-                    weights_index += 1
-                elif grid[i][j] == '.':
-                    switches_position.append((i, j))
-                elif grid[i][j] == '*':
-                    stones_weight[(i, j)] = weights[weights_index]
-                    weights_index += 1
-                    switches_position.append((i, j))
-                elif grid[i][j] == '+':
-                    switches_position.append((i, j))
-                    ares_position = (i, j)
+        # one scan of the whole maze for the cells that are not walls or floor,
+        # rows are joined so that the regex engine skips them in a single call
+        text = '\n'.join(rows)
+        (i, row_start, row_end) = (0, 0, len(rows[0]) if rows else 0)
+        for match in MazeState.objects.finditer(text):
+            position = match.start()
+            while position > row_end:
+                i += 1
+                row_start = row_end + 1
+                row_end = row_start + len(rows[i])
+            char = match.group()
+            j = position - row_start
+            if char in '@+':
+                ares_position = (i, j)
+            if char in '$*':
+                stones.append((i, j))
+            if char in '.*+':
+                switches_position.append((i, j))
+        if ares_position is None:
+            raise ValueError('The maze has no Ares')
+        if weights is None:
+            weights = [1] * len(stones)
+        if len(weights) != len(stones):
+            raise ValueError(f"The maze has {len(stones)} stones but {len(weights)} weights")
 
         return cls(grid, 
                    height, 
                    width, 
                    ares_position, 
-                   stones_weight, 
+                   dict(zip(stones, weights)), 
                    tuple(switches_position))
 
-
-
     @classmethod 
     def from_other_maze_state(cls, other):
         return cls(copy.deepcopy(other.grid), 
@@ -73,206 +89,110 @@ class MazeState:
                 return False
         return True
     
-    def can_move_up(self):
-        (i, j) = self.ares_position
-        # if the cell above is empty
-        if self.grid[i - 1][j] in (' ', '.'):
-            return True
-        # if the cell above is stone
-        if self.grid[i - 1][j] in ('$', '*') and self.grid[i - 2][j] in (' ', '.'):
-            return True
-        return False
-    
-    def can_move_left(self):
-        (i, j) = self.ares_position
-        # if the left cell is empty
-        if self.grid[i][j - 1] in (' ', '.'):
-            return True
-        # if the left cell is stone
-        if self.grid[i][j - 1] in ('$', '*') and self.grid[i][j - 2] in (' ', '.'):
-            return True
-        return False
-    
-    def can_move_down(self):
-        (i, j) = self.ares_position
-        # if the cell below is empty
-        if self.grid[i + 1][j] in (' ', '.'):
-            return True
-        # if the cell below is stone
-        if self.grid[i + 1][j] in ('$', '*') and self.grid[i + 2][j] in (' ', '.'):
-            return True
-        return False
-    
-    def can_move_right(self):
+    # cells holding Ares, a stone or a switch
+    objects = re.compile('[@+$*.]')
+
+    # (di, dj) of the four directions, in the order up, left, down, right
+    directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
+
+    def can_move(self, di, dj):
         (i, j) = self.ares_position
-        # if the right cell is empty
-        if self.grid[i][j + 1] in (' ', '.'):
+        # if the next cell is empty
+        if self.grid[i + di][j + dj] in (' ', '.'):
             return True
-        # if the left cell is stone
-        if self.grid[i][j + 1] in ('$', '*') and self.grid[i][j + 2] in (' ', '.'):
+        # if the next cell is stone
+        if self.grid[i + di][j + dj] in ('$', '*') and self.grid[i + 2 * di][j + 2 * dj] in (' ', '.'):
             return True
         return False
-    
-    def move_up(self):
+
+    def move(self, di, dj):
         (i, j) = self.ares_position
+        (ni, nj) = (i + di, j + dj)
+        (bi, bj) = (i + 2 * di, j + 2 * dj)
         new_state = MazeState.from_other_maze_state(self)
-        # no push stone
-        if self.grid[i - 1][j] in (' ', '.'):
-            # move ares
-            new_state.ares_position = (i - 1, j)
-            if self.grid[i - 1][j] == ' ':
-                new_state.grid[i - 1][j] = '@'
-            else:
-                new_state.grid[i - 1][j] = '+'
-            # change content of the old ares position
-            if self.grid[i][j] == '+': # ares on switch
-                new_state.grid[i][j] = '.'
-            else:
-                new_state.grid[i][j] = ' '
         # push stone
-        elif self.grid[i - 1][j] in ('$', '*') and self.grid[i - 2][j] in (' ', '.'):
+        if self.grid[ni][nj] in ('$', '*'):
+            if self.grid[bi][bj] not in (' ', '.'):
+                return new_state
             # move the stone
-            if self.grid[i - 2][j] == ' ':
-                new_state.grid[i - 2][j] = '$'
-            else:
-                new_state.grid[i - 2][j] = '*'
-            # move ares
-            new_state.ares_position = (i - 1, j)
-            if self.grid[i - 1][j] == '$':
-                new_state.grid[i - 1][j] = '@'
-            else:
-                new_state.grid[i - 1][j] = '+'
-            # change content of the old ares position
-            if self.grid[i][j] == '+': # ares on switch
-                new_state.grid[i][j] = '.'
-            else:
-                new_state.grid[i][j] = ' '
+            new_state.grid[bi][bj] = '$' if self.grid[bi][bj] == ' ' else '*'
             # modify stones' positions
-            weight = new_state.stones_weight.pop((i - 1, j))
-            new_state.stones_weight[(i - 2, j)] = weight
-        
+            weight = new_state.stones_weight.pop((ni, nj))
+            new_state.stones_weight[(bi, bj)] = weight
+        elif self.grid[ni][nj] not in (' ', '.'):
+            return new_state
+        # move ares
+        new_state.ares_position = (ni, nj)
+        new_state.grid[ni][nj] = '@' if self.grid[ni][nj] in (' ', '$') else '+'
+        # change content of the old ares position
+        new_state.grid[i][j] = '.' if self.grid[i][j] == '+' else ' '
         return new_state
-    
-    def move_left(self):
+
+    # make and unmake change this state in place instead of copying it:
+    # make applies a move and returns an undo record, (i, j, di, dj, pushed, weight),
+    # or None if the move is not legal, and unmake takes the last record made back
+    # pushed tells a push from a walk: the weight of the stone pushed may be 0
+    def make(self, di, dj):
         (i, j) = self.ares_position
-        new_state = MazeState.from_other_maze_state(self)
-        # no push stone
-        if self.grid[i][j - 1] in (' ', '.'):
-            # move ares
-            new_state.ares_position = (i, j - 1)
-            if self.grid[i][j - 1] == ' ':
-                new_state.grid[i][j - 1] = '@'
-            else:
-                new_state.grid[i][j - 1] = '+'
-            # change content of the old ares position
-            if self.grid[i][j] == '+': # ares on switch
-                new_state.grid[i][j] = '.'
-            else:
-                new_state.grid[i][j] = ' '
-        # push stone
-        elif self.grid[i][j - 1] in ('$', '*') and self.grid[i][j - 2] in (' ', '.'):
-            # move the stone
-            if self.grid[i][j - 2] == ' ':
-                new_state.grid[i][j - 2] = '$'
-            else:
-                new_state.grid[i][j - 2] = '*'
-            # move ares
-            new_state.ares_position = (i, j - 1)
-            if self.grid[i][j - 1] == '$':
-                new_state.grid[i][j - 1] = '@'
-            else:
-                new_state.grid[i][j - 1] = '+'
-            # change content of the old ares position
-            if self.grid[i][j] == '+': # ares on switch
-                new_state.grid[i][j] = '.'
-            else:
-                new_state.grid[i][j] = ' '
-            # modify stones' positions
-            weight = new_state.stones_weight.pop((i, j - 1))
-            new_state.stones_weight[(i, j - 2)] = weight
-        
-        return new_state
+        (ni, nj) = (i + di, j + dj)
+        grid = self.grid
+        pushed = False
+        weight = 0
+        if grid[ni][nj] in ('$', '*'):
+            (bi, bj) = (ni + di, nj + dj)
+            if grid[bi][bj] not in (' ', '.'):
+                return None
+            pushed = True
+            weight = self.stones_weight.pop((ni, nj))
+            self.stones_weight[(bi, bj)] = weight
+            grid[bi][bj] = '$' if grid[bi][bj] == ' ' else '*'
+            grid[ni][nj] = '@' if grid[ni][nj] == '$' else '+'
+        elif grid[ni][nj] in (' ', '.'):
+            grid[ni][nj] = '@' if grid[ni][nj] == ' ' else '+'
+        else:
+            return None
+        grid[i][j] = ' ' if grid[i][j] == '@' else '.'
+        self.ares_position = (ni, nj)
+        return i, j, di, dj, pushed, weight
+
+    def unmake(self, undo):
+        (i, j, di, dj, pushed, _) = undo
+        (ni, nj) = (i + di, j + dj)
+        grid = self.grid
+        grid[i][j] = '@' if grid[i][j] == ' ' else '+'
+        if pushed:
+            (bi, bj) = (ni + di, nj + dj)
+            grid[bi][bj] = ' ' if grid[bi][bj] == '$' else '.'
+            grid[ni][nj] = '$' if grid[ni][nj] == '@' else '*'
+            self.stones_weight[(ni, nj)] = self.stones_weight.pop((bi, bj))
+        else:
+            grid[ni][nj] = ' ' if grid[ni][nj] == '@' else '.'
+        self.ares_position = (i, j)
+
+    def can_move_up(self):
+        return self.can_move(-1, 0)
+
+    def can_move_left(self):
+        return self.can_move(0, -1)
+
+    def can_move_down(self):
+        return self.can_move(1, 0)
+
+    def can_move_right(self):
+        return self.can_move(0, 1)
+
+    def move_up(self):
+        return self.move(-1, 0)
+
+    def move_left(self):
+        return self.move(0, -1)
 
     def move_down(self):
-        (i, j) = self.ares_position
-        new_state = MazeState.from_other_maze_state(self)
-        # no push stone
-        if self.grid[i + 1][j] in (' ', '.'):
-            # move ares
-            new_state.ares_position = (i + 1, j)
-            if self.grid[i + 1][j] == ' ':
-                new_state.grid[i + 1][j] = '@'
-            else:
-                new_state.grid[i + 1][j] = '+'
-            # change content of the old ares position
-            if self.grid[i][j] == '+': # ares on switch
-                new_state.grid[i][j] = '.'
-            else:
-                new_state.grid[i][j] = ' '
-        # push stone
-        elif self.grid[i + 1][j] in ('$', '*') and self.grid[i + 2][j] in (' ', '.'):
-            # move the stone
-            if self.grid[i + 2][j] == ' ':
-                new_state.grid[i + 2][j] = '$'
-            else:
-                new_state.grid[i + 2][j] = '*'
-            # move ares
-            new_state.ares_position = (i + 1, j)
-            if self.grid[i + 1][j] == '$':
-                new_state.grid[i + 1][j] = '@'
-            else:
-                new_state.grid[i + 1][j] = '+'
-            # change content of the old ares position
-            if self.grid[i][j] == '+': # ares on switch
-                new_state.grid[i][j] = '.'
-            else:
-                new_state.grid[i][j] = ' '
-            # modify stones' positions
-            weight = new_state.stones_weight.pop((i + 1, j))
-            new_state.stones_weight[(i + 2, j)] = weight
-        
-        return new_state
-    
+        return self.move(1, 0)
+
     def move_right(self):
-        (i, j) = self.ares_position
-        new_state = MazeState.from_other_maze_state(self)
-        # no push stone
-        if self.grid[i][j + 1] in (' ', '.'):
-            # move ares
-            new_state.ares_position = (i, j + 1)
-            if self.grid[i][j + 1] == ' ':
-                new_state.grid[i][j + 1] = '@'
-            else:
-                new_state.grid[i][j + 1] = '+'
-            # change content of the old ares position
-            if self.grid[i][j] == '+': # ares on switch
-                new_state.grid[i][j] = '.'
-            else:
-                new_state.grid[i][j] = ' '
-        # push stone
-        elif self.grid[i][j + 1] in ('$', '*') and self.grid[i][j + 2] in (' ', '.'):
-            # move the stone
-            if self.grid[i][j + 2] == ' ':
-                new_state.grid[i][j + 2] = '$'
-            else:
-                new_state.grid[i][j + 2] = '*'
-            # move ares
-            new_state.ares_position = (i, j + 1)
-            if self.grid[i][j + 1] == '$':
-                new_state.grid[i][j + 1] = '@'
-            else:
-                new_state.grid[i][j + 1] = '+'
-            # change content of the old ares position
-            if self.grid[i][j] == '+': # ares on switch
-                new_state.grid[i][j] = '.'
-            else:
-                new_state.grid[i][j] = ' '
-            # modify stones' positions
-            weight = new_state.stones_weight.pop((i, j + 1))
-            new_state.stones_weight[(i, j + 2)] = weight
-        
-        return new_state
-    
+        return self.move(0, 1)
+
     def __eq__(self, other):
         if not isinstance(other, MazeState):
             return NotImplemented
@@ -292,174 +212,411 @@ class MazeState:
                      frozenset(self.stones_weight))) 
                      #self.switches_position))
 
+# Static part of a maze, flattened into a 1D board
+# A cell (i, j) is stored at index i * width + j
+# Shared by every MazeStateCompress of the same maze
+class MazeBoard:
+    def __init__(self, maze_state: MazeState):
+        self.height = maze_state.height
+        self.width = maze_state.width
+        self.size = self.height * self.width
+        # cell offsets of the four directions, in the order up, left, down, right
+        self.directions = (-self.width, -1, self.width, 1)
+        # static layers of the board, one byte per cell, found once for every state of the maze:
+        # interior: 1 if ares could ever walk on the cell, whatever the stones do
+        # walls:    1 if the cell is not interior, the floor outside the walls is wall here
+        # goals:    1 if the cell is a switch
+        # dead_squares: 1 if a stone on the cell can never reach a switch
+        self.interior = self.find_interior(maze_state)
+        self.walls = self.interior.translate(MazeBoard.flip)
+        self.switches = frozenset(self.index(i, j) for (i, j) in maze_state.switches_position)
+        self.goals = bytearray(self.size)
+        for cell in self.switches:
+            self.goals[cell] = 1
+        self.dead_squares = self.find_dead_squares()
+        self.switches_position = maze_state.switches_position
+        # the weight of each stone slot, sorted so that stones with equal weights are neighbours
+        self.stone_weights = tuple(sorted(maze_state.stones_weight.values()))
+        # for each stone slot, the (start, end) range of slots sharing its weight
+        self.weight_groups = []
+        for k in range(0, len(self.stone_weights)):
+            start = self.stone_weights.index(self.stone_weights[k])
+            end = start + self.stone_weights.count(self.stone_weights[k])
+            self.weight_groups.append((start, end))
+        self.weight_groups = tuple(self.weight_groups)
+        # for every floor cell, (direction, offset, target, push_to) of each direction
+        # ares can step to a floor cell from it; push_to is the cell a stone on target
+        # is pushed to, -1 if it is a wall, so a move is checked without reading walls
+        self.neighbours = tuple(self.cell_neighbours(cell) for cell in range(0, self.size))
+        # Zobrist keys: one random number per cell for ares, and one per cell for each weight class
+        # slot_keys[k] is the key table of the weight class of stone slot k
+        # seeded by the board size so a board always hashes the same way
+        rng = random.Random(self.size)
+        self.ares_keys = tuple(rng.getrandbits(64) for _ in range(0, self.size))
+        # class_keys[w] is the key table of the stones of weight w
+        self.class_keys = {}
+        for w in self.stone_weights:
+            if w not in self.class_keys:
+                self.class_keys[w] = tuple(rng.getrandbits(64) for _ in range(0, self.size))
+        self.slot_keys = tuple(self.class_keys[w] for w in self.stone_weights)
+
+    # bytearray.translate tables: 0/1 flags to 1/0, and maze characters to 1 for '#', 0 otherwise
+    flip = bytes.maketrans(b'\x00\x01', b'\x01\x00')
+    drawn_walls = bytes(int(byte == ord('#')) for byte in range(0, 256))
+
+    # flood fill from ares through every cell that is not '#', stones and switches included
+    # raises ValueError if the fill gets to the edge of the board, the maze is then not closed
+    def find_interior(self, maze_state: MazeState):
+        width = self.width
+        # 1 for the walls as drawn; MazeState.from_rows has padded short rows with floor,
+        # so every row is width long and the padding is interior only if ares can reach it
+        drawn = bytearray(''.join(''.join(row) for row in maze_state.grid),
+                          'ascii', 'replace').translate(MazeBoard.drawn_walls)
+        interior = bytearray(self.size)
+        start = self.index(*maze_state.ares_position)
+        interior[start] = 1
+        stack = [start]
+        while stack:
+            cell = stack.pop()
+            if cell < width or cell >= self.size - width or cell % width in (0, width - 1):
+                raise ValueError('The maze is not closed by walls')
+            for offset in self.directions:
+                next_cell = cell + offset
+                if not interior[next_cell] and not drawn[next_cell]:
+                    interior[next_cell] = 1
+                    stack.append(next_cell)
+        return interior
+
+    # a cell is dead if a stone on it can never reach a switch, even alone on the board
+    # found by pulling a stone backwards from every switch:
+    # a pull from cell to cell + offset needs ares on cell + offset and room on cell + 2 * offset
+    def find_dead_squares(self):
+        walls = self.walls
+        live = bytearray(self.size)
+        stack = list(self.switches)
+        for cell in stack:
+            live[cell] = 1
+        while stack:
+            cell = stack.pop()
+            for offset in self.directions:
+                if (not live[cell + offset]
+                    and not walls[cell + offset]
+                    and not walls[cell + 2 * offset]):
+                    live[cell + offset] = 1
+                    stack.append(cell + offset)
+        return bytearray(not walls[cell] and not live[cell] for cell in range(0, self.size))
+
+    def is_wall(self, cell):
+        return not 0 <= cell < self.size or self.walls[cell]
+
+    def cell_neighbours(self, cell):
+        if self.walls[cell]:
+            return ()
+        return tuple((direction, offset, cell + offset,
+                      -1 if self.is_wall(cell + 2 * offset) else cell + 2 * offset)
+                     for (direction, offset) in enumerate(self.directions)
+                     if not self.is_wall(cell + offset))
+
+    def index(self, i, j):
+        return i * self.width + j
+
+    def position(self, cell):
+        return divmod(cell, self.width)
+
+    # pack the stones of a {(i, j): w} dictionary into the canonical stones tuple
+    # slot k holds a stone of weight stone_weights[k], slots of equal weight are sorted by cell
+    def pack_stones(self, stones_weight):
+        return tuple(cell for (_, cell) in sorted((w, self.index(i, j))
+                                                  for ((i, j), w) in stones_weight.items()))
+
+    def unpack_stones(self, stones):
+        return {self.position(cell): w for (cell, w) in zip(stones, self.stone_weights)}
+
+    def zobrist_hash(self, ares, stones):
+        value = self.ares_keys[ares]
+        for (cell, keys) in zip(stones, self.slot_keys):
+            value ^= keys[cell]
+        return value
+
 # Compressed version of Mazestate
-# Need a Mazestate object to decompress
+# Only keeps the cell of Ares and a tuple of stone cells, the rest lives in the shared MazeBoard
 # Use to make search algorithms more effective
 class MazeStateCompress:
-    def __init__(self, ares_position, stones_weight, switches_position):
-        self.ares_position = ares_position
-        self.stones_weight = stones_weight
-        self.switches_position = switches_position
+    __slots__ = ('board', 'ares', 'stones', 'zobrist')
+
+    def __init__(self, board: MazeBoard, ares, stones, zobrist=None):
+        self.board = board      # the shared MazeBoard
+        self.ares = ares        # ares's cell index
+        self.stones = stones    # stone cells, see MazeBoard.pack_stones
+        # the Zobrist hash of the state, updated incrementally by move()
+        self.zobrist = board.zobrist_hash(ares, stones) if zobrist is None else zobrist
 
     @classmethod
     def from_original_maze_state(cls, maze_state: MazeState):
-        return cls(maze_state.ares_position,
-                   copy.deepcopy(maze_state.stones_weight),
-                   maze_state.switches_position)
+        board = MazeBoard(maze_state)
+        (i, j) = maze_state.ares_position
+        return cls(board, board.index(i, j), board.pack_stones(maze_state.stones_weight))
+
     @classmethod
     def from_other_compress_state(cls, other):
-        return cls(other.ares_position,
-                   copy.deepcopy(other.stones_weight),
-                   other.switches_position)
-    
+        return cls(other.board, other.ares, other.stones, other.zobrist)
+
+    @property
+    def ares_position(self):
+        return self.board.position(self.ares)
+
+    @property
+    def stones_weight(self):
+        return self.board.unpack_stones(self.stones)
+
+    @property
+    def switches_position(self):
+        return self.board.switches_position
+
     def __eq__(self, other):
         if not isinstance(other, MazeStateCompress):
             return NotImplemented
-        return (self.ares_position == other.ares_position
-                and self.stones_weight == other.stones_weight)
-    
+        return (self.zobrist == other.zobrist
+                and self.ares == other.ares
+                and self.stones == other.stones)
+
     def __hash__(self):
-        return hash((self.ares_position,
-                    frozenset(self.stones_weight)))
-    
+        return self.zobrist
+
     def is_goal_state(self):
-        for (i, j) in self.stones_weight:
-            if (i, j) not in self.switches_position:
+        switches = self.board.switches
+        for cell in self.stones:
+            if cell not in switches:
                 return False
         return True
-    
-    def can_move_up(self, maze_state: MazeState):
-        (i, j) = self.ares_position
-        # if the cell above is empty
-        if (maze_state.grid[i - 1][j] != '#' 
-            and (i - 1, j) not in self.stones_weight):
-            return True
-        # if the cell above is stone
-        if ((i - 1, j) in self.stones_weight
-            and maze_state.grid[i - 2][j] != '#'
-            and (i - 2, j) not in self.stones_weight):
-                return True
-        return False
-    
-    def can_move_left(self, maze_state: MazeState):
-        (i, j) = self.ares_position
-        # if the left cell is empty
-        if (maze_state.grid[i][j - 1] != '#' 
-            and (i, j - 1) not in self.stones_weight):
-            return True
-        # if the left cell is stone
-        if ((i, j - 1) in self.stones_weight
-            and maze_state.grid[i][j - 2] != '#'
-            and (i, j - 2) not in self.stones_weight):
-                return True
-        return False
-    
-    def can_move_down(self, maze_state: MazeState):
-        (i, j) = self.ares_position
-        # if the cell above is empty
-        if (maze_state.grid[i + 1][j] != '#' 
-            and (i + 1, j) not in self.stones_weight):
-            return True
-        # if the cell above is stone
-        if ((i + 1, j) in self.stones_weight
-            and maze_state.grid[i + 2][j] != '#'
-            and (i + 2, j) not in self.stones_weight):
-                return True
-        return False
-    
-    def can_move_right(self, maze_state: MazeState):
-        (i, j) = self.ares_position
-        # if the left cell is empty
-        if (maze_state.grid[i][j + 1] != '#' 
-            and (i, j + 1) not in self.stones_weight):
+
+    def weight_at(self, cell):
+        # weight of the stone on the given cell, 0 if there is no stone
+        if cell not in self.stones:
+            return 0
+        return self.board.stone_weights[self.stones.index(cell)]
+
+    def can_move(self, offset):
+        target = self.ares + offset
+        # if the target cell is empty
+        if not self.board.walls[target] and target not in self.stones:
             return True
-        # if the left cell is stone
-        if ((i, j + 1) in self.stones_weight
-            and maze_state.grid[i][j + 2] != '#'
-            and (i, j + 2) not in self.stones_weight):
+        # if the target cell is stone
+        if (target in self.stones
+            and not self.board.walls[target + offset]
+            and target + offset not in self.stones):
                 return True
         return False
-    
+
+    # every state one step away, as (direction index, whether a stone is pushed, new state),
+    # in one pass over the neighbour table of ares's cell
+    def successors(self):
+        board = self.board
+        stones = self.stones
+        ares_keys = board.ares_keys
+        zobrist = self.zobrist ^ ares_keys[self.ares]
+        for (direction, offset, target, push_to) in board.neighbours[self.ares]:
+            if target not in stones:
+                yield direction, False, MazeStateCompress(board, target, stones, zobrist ^ ares_keys[target])
+            elif push_to != -1 and push_to not in stones:
+                yield direction, True, self.push(target, offset)
+
+    def move(self, offset):
+        board = self.board
+        target = self.ares + offset
+        if target in self.stones:
+            return self.push(target, offset)
+        zobrist = self.zobrist ^ board.ares_keys[self.ares] ^ board.ares_keys[target]
+        return MazeStateCompress(board, target, self.stones, zobrist)
+
+    # ares walks next to the stone on the given cell and pushes it by offset
+    # the caller must check that ares can reach (stone - offset) and the push is legal
+    def push(self, stone, offset):
+        board = self.board
+        zobrist = self.zobrist ^ board.ares_keys[self.ares] ^ board.ares_keys[stone]
+        # move the stone, then restore the cell order inside its weight group
+        stones = list(self.stones)
+        k = stones.index(stone)
+        keys = board.slot_keys[k]
+        zobrist ^= keys[stone] ^ keys[stone + offset]
+        (start, end) = board.weight_groups[k]
+        stones[k] = stone + offset
+        if end - start > 1:
+            stones[start:end] = sorted(stones[start:end])
+        return MazeStateCompress(board, stone, tuple(stones), zobrist)
+
+    # ares jumps to the given cell, the caller must check that ares can walk there
+    def with_ares(self, cell):
+        board = self.board
+        zobrist = self.zobrist ^ board.ares_keys[self.ares] ^ board.ares_keys[cell]
+        return MazeStateCompress(board, cell, self.stones, zobrist)
+
+    # cells ares can walk to without pushing any stone, as a bytearray of 0/1 flags
+    def reachable(self):
+        walls = self.board.walls
+        directions = self.board.directions
+        reached = bytearray(self.board.size)
+        reached[self.ares] = 1
+        stack = [self.ares]
+        while stack:
+            cell = stack.pop()
+            for offset in directions:
+                next_cell = cell + offset
+                if not reached[next_cell] and not walls[next_cell] and next_cell not in self.stones:
+                    reached[next_cell] = 1
+                    stack.append(next_cell)
+        return reached
+
+    # shortest list of offsets for ares to walk to target without pushing any stone
+    # None if target cannot be reached
+    def walk_path(self, target):
+        walls = self.board.walls
+        directions = self.board.directions
+        parent = {self.ares: None}
+        q = deque([self.ares])
+        while q:
+            cell = q.popleft()
+            if cell == target:
+                offsets = []
+                while parent[cell] is not None:
+                    offsets.append(parent[cell])
+                    cell -= parent[cell]
+                offsets.reverse()
+                return offsets
+            for offset in directions:
+                next_cell = cell + offset
+                if next_cell not in parent and not walls[next_cell] and next_cell not in self.stones:
+                    parent[next_cell] = offset
+                    q.append(next_cell)
+        return None
+
+    # maze_state is no longer needed since the state carries its board,
+    # it is kept so callers written for the old API still work
+    def can_move_up(self, maze_state: MazeState = None):
+        return self.can_move(-self.board.width)
+
+    def can_move_left(self, maze_state: MazeState = None):
+        return self.can_move(-1)
+
+    def can_move_down(self, maze_state: MazeState = None):
+        return self.can_move(self.board.width)
+
+    def can_move_right(self, maze_state: MazeState = None):
+        return self.can_move(1)
+
     def move_up(self):
-        new_compress_state = MazeStateCompress.from_other_compress_state(self)
-        (i, j) = self.ares_position
-        new_compress_state.ares_position = (i - 1, j)
-        if (i - 1, j) in new_compress_state.stones_weight:
-            weight = new_compress_state.stones_weight.pop((i - 1, j))
-            new_compress_state.stones_weight[(i - 2, j)] = weight
-        
-        return new_compress_state
-    
+        return self.move(-self.board.width)
+
     def move_left(self):
-        new_compress_state = MazeStateCompress.from_other_compress_state(self)
-        (i, j) = self.ares_position
-        new_compress_state.ares_position = (i, j - 1)
-        if (i, j - 1) in new_compress_state.stones_weight:
-            weight = new_compress_state.stones_weight.pop((i, j - 1))
-            new_compress_state.stones_weight[(i, j - 2)] = weight
-        
-        return new_compress_state
+        return self.move(-1)
 
     def move_down(self):
-        new_compress_state = MazeStateCompress.from_other_compress_state(self)
-        (i, j) = self.ares_position
-        new_compress_state.ares_position = (i + 1, j)
-        if (i + 1, j) in new_compress_state.stones_weight:
-            weight = new_compress_state.stones_weight.pop((i + 1, j))
-            new_compress_state.stones_weight[(i + 2, j)] = weight
-        
-        return new_compress_state
-    
+        return self.move(self.board.width)
+
     def move_right(self):
-        new_compress_state = MazeStateCompress.from_other_compress_state(self)
-        (i, j) = self.ares_position
-        new_compress_state.ares_position = (i, j + 1)
-        if (i, j + 1) in new_compress_state.stones_weight:
-            weight = new_compress_state.stones_weight.pop((i, j + 1))
-            new_compress_state.stones_weight[(i, j + 2)] = weight
-        
-        return new_compress_state
-    
+        return self.move(1)
+
     def decompress(self, maze_state: MazeState):
         original_maze_state = MazeState.from_other_maze_state(maze_state)
         original_maze_state.ares_position = self.ares_position
-        original_maze_state.stones_weight = copy.deepcopy(self.stones_weight)
+        original_maze_state.stones_weight = self.stones_weight
 
         # reset old contents
         for (i, j) in maze_state.stones_weight:
-            if (i, j) in self.switches_position:
+            if (i, j) in maze_state.switches_position:
                 original_maze_state.grid[i][j] = '.'
             else:
                 original_maze_state.grid[i][j] = ' '
         (i, j) = maze_state.ares_position
-        if (i, j) not in self.switches_position:
+        if (i, j) not in maze_state.switches_position:
             original_maze_state.grid[i][j] = ' '
         else:
             original_maze_state.grid[i][j] = '.'
 
         # insert new contents
-        for (i, j) in self.stones_weight:
-            if (i, j) in self.switches_position:
+        for (i, j) in original_maze_state.stones_weight:
+            if (i, j) in maze_state.switches_position:
                 original_maze_state.grid[i][j] = '*'
             else:
                 original_maze_state.grid[i][j] = '$'
 
         (i, j) = self.ares_position
-        if (i, j) in self.switches_position:
+        if (i, j) in maze_state.switches_position:
             original_maze_state.grid[i][j] = '+'
         else:
             original_maze_state.grid[i][j] = '@'
 
         return original_maze_state
 
-        
+# The states of a solution, rebuilt on demand from the initial state and the move string
+# instead of keeping one full MazeState per step
+# indexed like the solvers' old path lists, in reverse order: replay[0] is the final state
+# and replay[-1] the initial one, while frame(step) and frames() go forwards
+class MazeReplay:
+    checkpoint_interval = 64    # a compressed state is kept every this many steps
 
+    def __init__(self, initial_state: MazeState, moves):
+        self.initial_state = initial_state
+        self.moves = moves
+        state = MazeStateCompress.from_original_maze_state(initial_state)
+        self.board = state.board
+        self.checkpoints = [state]
+        for (step, move) in enumerate(moves, 1):
+            offset = self.offset(move)
+            if offset is None or not state.can_move(offset):
+                raise ValueError(f"Illegal move '{move}' at step {step}")
+            state = state.move(offset)
+            if step % MazeReplay.checkpoint_interval == 0:
+                self.checkpoints.append(state)
+        self.final_state = state
+        # the last compressed frame asked for, so that stepping forwards costs one move
+        self.cursor = (0, self.checkpoints[0])
 
-         
+    def offset(self, move):
+        char = move.lower()
+        if char not in 'uldr':
+            return None
+        return self.board.directions['uldr'.index(char)]
 
+    def __len__(self):
+        return len(self.moves) + 1
 
-        
-    
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('replay index out of range')
+        return self.frame(len(self) - 1 - index)
 
-        
-    
+    def __reversed__(self):
+        return self.frames()
+
+    # the compressed state after the given number of steps
+    def compressed_frame(self, step):
+        (cursor_step, state) = self.cursor
+        if not cursor_step <= step < cursor_step + MazeReplay.checkpoint_interval:
+            cursor_step = step - step % MazeReplay.checkpoint_interval
+            state = self.checkpoints[cursor_step // MazeReplay.checkpoint_interval]
+        for move in self.moves[cursor_step:step]:
+            state = state.move(self.offset(move))
+        self.cursor = (step, state)
+        return state
+
+    # the full MazeState after the given number of steps
+    def frame(self, step):
+        return self.compressed_frame(step).decompress(self.initial_state)
+
+    # every full MazeState from the initial one to the final one, built one at a time
+    def frames(self):
+        state = self.checkpoints[0]
+        yield state.decompress(self.initial_state)
+        for move in self.moves:
+            state = state.move(self.offset(move))
+            yield state.decompress(self.initial_state)
+
+    # the weight pushed by the move that leads to the given step, 0 for the initial state
+    def step_cost(self, step):
+        if step == 0:
+            return 0
+        state = self.compressed_frame(step - 1)
+        return state.weight_at(state.ares + self.offset(self.moves[step - 1]))
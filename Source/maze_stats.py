@@ -0,0 +1,83 @@
+import maze_state as ms
+import sys
+
+# Counters of one search, kept by the solver as it goes, see MazeSolver.finish_search
+# they cost an addition here and there, memory is sized once the search is over:
+# structure_bytes from the arrays of the closed set and a sample entry of the open list,
+# traced_bytes from tracemalloc, only when the search ran under solve_and_track_memory,
+# which is opt-in since tracing slows the search down several times
+class SearchStats:
+    def __init__(self):
+        self.generated = 0          # successors made by next_states and next_pull_states
+        self.expanded = 0           # states taken off the open list to be expanded, state_visited
+        self.duplicates = 0         # successors and open list entries dropped as already reached
+        self.deadlocks = 0          # states pruned by the deadlock detectors
+        self.open_peak = 0          # most entries in the open list at once
+        self.closed_size = 0        # states kept in the closed set when the search ended
+        self.time_ms = 0.0
+        self.structure_bytes = 0    # closed set arrays, and the open list at its peak, estimated
+        self.traced_bytes = None    # peak of memory allocated during the search, None if not traced
+
+    # add the counters of a search run alongside, such as another worker of maze_parallel
+    def add(self, other):
+        self.generated += other.generated
+        self.expanded += other.expanded
+        self.duplicates += other.duplicates
+        self.deadlocks += other.deadlocks
+        self.open_peak += other.open_peak
+        self.closed_size += other.closed_size
+        self.structure_bytes += other.structure_bytes
+
+    @property
+    def nodes_per_sec(self):
+        return self.expanded * 1000 / self.time_ms if self.time_ms > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'generated': self.generated,
+            'expanded': self.expanded,
+            'duplicates': self.duplicates,
+            'deadlocks': self.deadlocks,
+            'open_peak': self.open_peak,
+            'closed_size': self.closed_size,
+            'time_ms': round(self.time_ms, 2),
+            'nodes_per_sec': round(self.nodes_per_sec, 1),
+            'structure_bytes': self.structure_bytes,
+            'traced_bytes': self.traced_bytes,
+        }
+
+    # back from as_dict(), such as stats kept by maze_cache
+    @classmethod
+    def from_dict(cls, values):
+        stats = cls()
+        for (name, value) in values.items():
+            if name != 'nodes_per_sec':
+                setattr(stats, name, value)
+        return stats
+
+    # the stats line of an output-XX.txt block
+    def format(self):
+        line = (f"Generated: {self.generated}, "
+                f"Expanded: {self.expanded}, "
+                f"Duplicates: {self.duplicates}, "
+                f"Deadlocks: {self.deadlocks}, "
+                f"Open peak: {self.open_peak}, "
+                f"Closed: {self.closed_size}, "
+                f"Nodes/s: {self.nodes_per_sec:.0f}, "
+                f"Bytes: {self.structure_bytes}")
+        if self.traced_bytes is not None:
+            line += f", Traced bytes: {self.traced_bytes}"
+        return line
+
+# rough size of an open list entry: the entry and what it holds, one level down,
+# the board every state shares is left out
+def entry_bytes(entry):
+    items = entry if isinstance(entry, (tuple, list)) else (entry,)
+    size = sys.getsizeof(entry) if items is entry else 0
+    for item in items:
+        size += sys.getsizeof(item)
+        if isinstance(item, ms.MazeStateCompress):
+            size += sys.getsizeof(item.stones)
+        elif isinstance(item, tuple):
+            size += sum(sys.getsizeof(value) for value in item)
+    return size
@@ -1,7 +1,9 @@
 import pygame
 import time
 import sys
-from maze_solver import *
+from maze_solver import MazeSolverBFS, MazeSolverDFS, MazeSolverUCS, MazeSolverAStar
+from maze_portfolio import SolverResult, write_output
+from maze_cache import ResultCache, solve_cached
 
 class Button:
     def __init__(self, image_path, x, y, action=None):
@@ -176,39 +178,6 @@ class MazeVisualizer:
         text_rect = weight_text.get_rect(center=(x * self.block_size + self.block_size // 2, y * self.block_size + self.block_size // 2))
         self.screen.blit(weight_text, text_rect)  # Draw the weight text
 
-    def is_inside_maze(self, state, i, j):
-        # check above:
-        check = False
-        for row in range(i - 1, -1, -1):
-            if state.grid[row][j] == '#':
-                check = True
-                break
-        if not check:
-            return False
-        # check below:
-        check = False
-        for row in range(i + 1, state.height, 1):
-            if state.grid[row][j] == '#':
-                check = True
-                break
-        if not check:
-            return False
-        # check left:
-        check = False
-        for col in range(j - 1, -1, -1):
-            if state.grid[i][col] == '#':
-                check = True
-                break
-        if not check:
-            return False
-        # check right:
-        check = False
-        for col in range(j + 1, len(state.grid[i]), 1):
-            if state.grid[i][col] == '#':
-                check = True
-                break
-        return check
-    
     def draw_background(self, parallax_bg: bool = False):
         """Draw parallax background layers horizontally"""
         if parallax_bg:
@@ -232,11 +201,13 @@ class MazeVisualizer:
         # for bg_image in self.background_images:
         #     self.screen.blit(bg_image, (0, 0))
         """Draw wall and space"""
+        # the floor inside the walls is found once per maze, see maze_state.MazeBoard.interior
+        board = self.current_solver.board
         for y, row in enumerate(state.grid):
             for x, cell in enumerate(row):
                 if cell == '#':
                     self.screen.blit(self.block_images["wall"], (x * self.block_size, y * self.block_size))
-                elif self.is_inside_maze(state, y, x):
+                elif board.interior[board.index(y, x)]:
                     self.screen.blit(self.block_images["space"], (x * self.block_size, y * self.block_size))
 
         """Draw the objects"""
@@ -275,36 +246,33 @@ class MazeVisualizer:
         """Solve the maze"""
         if not self.is_solved:
             self.draw_solving_text()
-            if not self.astar_solver.solve_and_track_memory():
-                self.show_error_message("The maze is not solvable!")
-                return
-            self.bfs_solver.solve_and_track_memory()
-            self.dfs_solver.solve_and_track_memory()
-            self.ucs_solver.solve_and_track_memory()
+            # solutions of earlier sessions, see maze_cache.py
+            with ResultCache() as cache:
+                if not solve_cached(cache, "A*", self.astar_solver):
+                    self.show_error_message("The maze is not solvable!")
+                    return
+                solve_cached(cache, "BFS", self.bfs_solver)
+                solve_cached(cache, "DFS", self.dfs_solver)
+                solve_cached(cache, "UCS", self.ucs_solver)
             self.grid = self.current_solver.initial_state.grid
             self.is_solved = True
         
         """Save output to file"""
         output_filename = "output-" + self.input_filename[6:]
-        with open(output_filename, 'w', encoding='utf-8') as file:
-            for (algo, solver) in (("BFS", self.bfs_solver),
-                                   ("DFS", self.dfs_solver),
-                                   ("UCS", self.ucs_solver),
-                                   ("A*", self.astar_solver)):
-                file.write(algo + "\n")
-                file.write(f"Steps: {len(solver.path) - 1}, "\
-                       f"Weight: {solver.cost}, "\
-                       f"Node: {solver.state_visited}, "\
-                       f"Time (ms): {solver.time_consume:.2f}, "\
-                       f"Memory (MB): {solver.memory_consume:.2f}\n")
-                file.write(solver.str_path + "\n")
+        write_output(output_filename,
+                     [SolverResult.from_solver(algo, solver)
+                      for (algo, solver) in (("BFS", self.bfs_solver),
+                                             ("DFS", self.dfs_solver),
+                                             ("UCS", self.ucs_solver),
+                                             ("A*", self.astar_solver))])
 
     def solve(self):
         if not self.is_solved:
             self.draw_solving_text()
-            if not self.astar_solver.solve_maze():
-                self.show_error_message("The maze is not solvable!")
-                return
+            with ResultCache() as cache:
+                if not solve_cached(cache, "A*", self.astar_solver):
+                    self.show_error_message("The maze is not solvable!")
+                    return
         self.current_solver = self.astar_solver
 
     def animate_solution(self, quick_start=False):
@@ -313,9 +281,11 @@ class MazeVisualizer:
         elif quick_start:
             self.solve()
         """Animate each step of the solution path."""
+        # frames are replayed one at a time from the move string, see maze_state.MazeReplay
+        replay = self.current_solver.path
         weight_pushed = 0
-        i = len(self.current_solver.path) - 1
-        while (i >= 0):
+        step = 0
+        while (step < len(replay)):
             # Event handling to allow quitting the application
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -336,22 +306,21 @@ class MazeVisualizer:
                 time.sleep(0.1)
                 continue
 
-            state = self.current_solver.path[i]
-            if i < len(self.current_solver.path) - 1:
-                weight_pushed += MazeSolver.step_cost(self.current_solver.path[i + 1], self.current_solver.path[i])
+            weight_pushed += replay.step_cost(step)
+            state = replay.frame(step)
             # Draw the current state of the grid
             self.screen.fill((0, 0, 0))
             self.draw_grid(state)
             self.draw_buttons()
 
             # Write statistic
-            step_text = self.font.render(f"Step: {len(self.current_solver.path) - 1 - i}", True, (255, 255, 255))  # White color
+            step_text = self.font.render(f"Step: {step}", True, (255, 255, 255))  # White color
             self.screen.blit(step_text, (10, 800))
             weight_text = self.font.render(f"Weight pushed: {weight_pushed}", True, (255, 255, 255)) 
             self.screen.blit(weight_text, (10, 850))
             
             # Display SOLVED text for both quickstart and normal mode when solution is found
-            if i == 0 and (self.is_solved or quick_start):
+            if step == len(replay) - 1 and (self.is_solved or quick_start):
                 solved_text = self.font.render("SOLVED", True, (0, 255, 0))  
                 self.screen.blit(solved_text, (10, 750))
 
@@ -360,7 +329,7 @@ class MazeVisualizer:
 
             time.sleep(0.17)  # Adjust delay for animation speed
             self.clock.tick(60)  # Limit to 60 frames per second
-            i -= 1
+            step += 1
         
         # After animation, keep screen until user do something
         while True:
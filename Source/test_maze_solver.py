@@ -0,0 +1,404 @@
+import maze_state as ms
+import maze_solver as mso
+import maze_heuristic as mh
+import maze_portfolio as mp
+import maze_pack as mpk
+import maze_macro as mm
+import maze_queue as mq
+import maze_arena as ma
+import maze_benchmark as mbe
+import maze_cache as mc
+import random
+import os
+import tempfile
+import unittest
+
+# Regression tests, run from this folder with
+#   python -m unittest test_maze_solver
+# mazes are given as rows, see MazeState.from_rows
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+def maze(weights, rows):
+    return ms.MazeState.from_rows(weights, rows)
+
+# more switches than stones: the incremental matching must give the same bound as a full one
+RECTANGULAR = ([27, 22], ['###########',
+                          '#    #    #',
+                          '#  #   #.##',
+                          '#.  $$.   #',
+                          '##      . #',
+                          '#       @ #',
+                          '#     ##. #',
+                          '###########'])
+
+class MatchingHeuristicTest(unittest.TestCase):
+    def test_rectangular_update_matches_evaluate(self):
+        solver = mso.MazeSolverAStar(maze(*RECTANGULAR))
+        heuristic = mh.MatchingHeuristic(solver.board)
+        state = solver.compress_initial_state
+        record = heuristic.evaluate(state.stones)
+        for (_, is_push, new_state) in state.successors():
+            if is_push:
+                new_record = heuristic.update(record, state.stones, new_state.stones)
+                self.assertEqual(heuristic.evaluate(new_state.stones), new_record)
+
+    def test_rectangular_astar_is_optimal(self):
+        for solver_class in (mso.MazeSolverAStar, mso.MazeSolverIDAStar):
+            solver = solver_class(maze(*RECTANGULAR))
+            self.assertTrue(solver.solve_maze())
+            self.assertEqual(solver.cost, 142)
+
+class BidirectionalTest(unittest.TestCase):
+    # the forward side runs out of states before the backward side expands a goal
+    def test_forward_side_meets_the_goals(self):
+        state = maze([19, 1, 11], ['##########',
+                                   '###@#  # #',
+                                   '#.#   ## #',
+                                   '# $$#  $.#',
+                                   '#  .#    #',
+                                   '##########'])
+        solver = mso.MazeSolverBidirectional(state)
+        self.assertTrue(solver.solve_maze())
+        self.assertEqual(solver.cost, 50)
+
+    # stones of one weight give combinations of switches, not permutations
+    def test_goal_stones_of_equal_weights(self):
+        state = maze(None, ['##########',
+                            '#@ $ $ $ #',
+                            '# ...... #',
+                            '#        #',
+                            '##########'])
+        solver = mso.MazeSolverBidirectional(state)
+        layouts = solver.goal_stones()
+        self.assertEqual(len(layouts), 20)
+        self.assertEqual(len(set(layouts)), 20)
+
+class InPlaceTest(unittest.TestCase):
+    # a stone of weight 0 is still pushed, make and unmake must not take it for a walk
+    def test_zero_weight_stone(self):
+        rows = ['#######',
+                '#@$ . #',
+                '#######']
+        for in_place in (False, True):
+            solver = mso.MazeSolverDFS(maze([0], rows), in_place=in_place)
+            self.assertTrue(solver.solve_maze())
+            self.assertEqual(solver.str_path, 'RR')
+            self.assertEqual(solver.cost, 0)
+
+    def test_make_unmake_zero_weight(self):
+        state = maze([0], ['#######',
+                           '#@$ . #',
+                           '#######'])
+        grid = [list(row) for row in state.grid]
+        undo = state.make(0, 1)
+        self.assertTrue(undo[4])
+        self.assertEqual(state.stones_weight, {(1, 3): 0})
+        state.unmake(undo)
+        self.assertEqual(state.grid, grid)
+        self.assertEqual(state.stones_weight, {(1, 2): 0})
+        self.assertEqual(state.ares_position, (1, 1))
+
+class TunnelTest(unittest.TestCase):
+    def push_right(self, rows):
+        solver = mso.MazeSolverAStar(maze([3], rows))
+        board = solver.board
+        macro = mm.TunnelMacro(board)
+        (up, left, down, right) = board.directions
+        stone = solver.compress_initial_state.stones[0]
+        state = solver.compress_initial_state.push(stone, right)
+        return board, macro.extend(state, stone + right, board.directions.index(right))
+
+    # ares is still outside, at the mouth, when the stone enters the tunnel
+    def test_pushed_in_from_the_mouth(self):
+        rows = ['##########',
+                '#   ######',
+                '# @$    .#',
+                '#   ######',
+                '##########']
+        (board, (state, pushes)) = self.push_right(rows)
+        self.assertEqual(len(pushes), 4)
+        self.assertEqual(state.stones, (board.index(2, 8),))
+        solver = mso.MazeSolverAStar(maze([3], rows), macros=('tunnel',))
+        self.assertTrue(solver.solve_maze())
+        self.assertEqual(solver.cost, 15)
+        self.assertEqual(solver.str_path, 'RRRRR')
+
+    # a stone may be left in a doorway while ares goes round
+    def test_doorway(self):
+        (_, (_, pushes)) = self.push_right(['#########',
+                                            '#   #   #',
+                                            '# @$ .  #',
+                                            '#   #   #',
+                                            '#########'])
+        self.assertEqual(pushes, [])
+
+class GoalRoomTest(unittest.TestCase):
+    # a stone already in the right room must not stop the left one from being filled
+    def test_rooms_are_counted_apart(self):
+        solver = mso.MazeSolverAStar(maze(None, ['#########',
+                                                 '#..$@ .*#',
+                                                 '#########']))
+        board = solver.board
+        macro = mm.GoalRoomMacro(board)
+        self.assertEqual(len(macro.rooms), 2)
+        (up, left, down, right) = board.directions
+        state = solver.compress_initial_state
+        (new_state, pushes) = macro.extend(state, board.index(1, 3), board.directions.index(left))
+        self.assertEqual(len(pushes), 2)
+        self.assertIn(board.index(1, 1), new_state.stones)
+
+class PackTest(unittest.TestCase):
+    def read(self, text):
+        with tempfile.NamedTemporaryFile('w', suffix='.xsb', delete=False) as file:
+            file.write(text)
+        self.addCleanup(os.remove, file.name)
+        return list(mpk.read_pack_levels(file.name))
+
+    # a numeric title is not taken for the weights of a level with a different stone count,
+    # one with a number per stone still is
+    def test_numeric_title(self):
+        levels = self.read('1\n'
+                           '#######\n'
+                           '#@$$..#\n'
+                           '#######\n'
+                           '42\n'
+                           '#####\n'
+                           '#@$.#\n'
+                           '#####\n')
+        self.assertEqual([weights for (weights, _) in levels], [None, [42]])
+
+    def test_weights_marker(self):
+        levels = self.read('Weights: 3\n'
+                           '#######\n'
+                           '#@$$..#\n'
+                           '#######\n'
+                           '5 7\n'
+                           '#######\n'
+                           '#@$$..#\n'
+                           '#######\n')
+        self.assertEqual([weights for (weights, _) in levels], [[3], [5, 7]])
+        with self.assertRaises(ValueError):
+            ms.MazeState.from_rows(*levels[0])
+
+class NormalizeTest(unittest.TestCase):
+    # duplicates drop their flood fill, what is left is counted in the structure bytes
+    def test_reachable_cache(self):
+        solver = mso.MazeSolverUCS(maze(*RECTANGULAR), normalize_player=True)
+        self.assertTrue(solver.solve_maze())
+        self.assertGreater(solver.stats.duplicates, len(solver.reachable_cache))
+        self.assertGreaterEqual(solver.stats.structure_bytes, solver.reachable_cache_bytes())
+
+class QueueTest(unittest.TestCase):
+    # by key, then by tie break, equal pairs last in first out
+    def test_order_and_ties(self):
+        for queue in mq.QUEUES.values():
+            pq = queue()
+            for (key, tie_break, item) in ((3, 0, 'a'), (1, 2, 'b'), (1, 1, 'c'), (1, 2, 'd'), (0, 5, 'e')):
+                pq.push(key, tie_break, item)
+            self.assertEqual(len(pq), 5)
+            self.assertEqual(pq.min_key(), 0)
+            self.assertEqual([pq.pop() for _ in range(0, 5)], ['e', 'c', 'd', 'b', 'a'])
+            self.assertEqual(len(pq), 0)
+            with self.assertRaises(IndexError):
+                pq.min_key()
+
+    # a key smaller than the last one popped still comes out first
+    def test_push_below_popped_key(self):
+        for queue in mq.QUEUES.values():
+            pq = queue()
+            pq.push(5, 0, 'a')
+            pq.push(7, 0, 'b')
+            self.assertEqual(pq.pop(), 'a')
+            pq.push(2, 0, 'c')
+            self.assertEqual(pq.min_key(), 2)
+            self.assertEqual([pq.pop(), pq.pop()], ['c', 'b'])
+
+    def test_queues_agree(self):
+        rng = random.Random(7)
+        queues = [queue() for queue in mq.QUEUES.values()]
+        popped = [[] for _ in queues]
+        for n in range(0, 2000):
+            if rng.random() < 0.6:
+                (key, tie_break) = (rng.randrange(0, 50), rng.randrange(0, 5))
+                for pq in queues:
+                    pq.push(key, tie_break, n)
+            elif queues[0]:
+                for (pq, items) in zip(queues, popped):
+                    items.append(pq.pop())
+        self.assertEqual(popped[0], popped[1])
+
+class ReplayTest(unittest.TestCase):
+    # input-02's solution is longer than a checkpoint interval
+    def setUp(self):
+        solver = mso.MazeSolverAStar.from_file(os.path.join(FOLDER, 'input-02.txt'))
+        self.assertTrue(solver.solve_maze())
+        self.solver = solver
+        self.replay = solver.path
+        # every frame in full, made with make on a copy of the maze
+        state = ms.MazeState.from_other_maze_state(solver.initial_state)
+        self.grids = [[list(row) for row in state.grid]]
+        for move in solver.str_path:
+            (di, dj) = {'u': (-1, 0), 'l': (0, -1), 'd': (1, 0), 'r': (0, 1)}[move.lower()]
+            self.assertIsNotNone(state.make(di, dj))
+            self.grids.append([list(row) for row in state.grid])
+
+    def test_forward_and_backward(self):
+        replay = self.replay
+        self.assertGreater(len(replay), ms.MazeReplay.checkpoint_interval)
+        self.assertEqual(len(replay), len(self.grids))
+        self.assertEqual([frame.grid for frame in replay.frames()], self.grids)
+        for step in range(0, len(replay)):
+            self.assertEqual(replay.frame(step).grid, self.grids[step])
+        for step in reversed(range(0, len(replay))):
+            self.assertEqual(replay.frame(step).grid, self.grids[step])
+        # the solver's path is indexed from the final state back
+        self.assertEqual(replay[0].grid, self.grids[-1])
+        self.assertEqual(replay[-1].grid, self.grids[0])
+
+    def test_step_costs(self):
+        replay = self.replay
+        self.assertEqual(sum(replay.step_cost(step) for step in range(0, len(replay))), self.solver.cost)
+
+    def test_illegal_move(self):
+        with self.assertRaises(ValueError):
+            ms.MazeReplay(self.solver.initial_state, 'uuuuuuuuuuuu')
+
+class NodeArenaTest(unittest.TestCase):
+    # enough nodes to grow the table several times, some hashes collide in the low bits
+    def test_insert_lookup_grow(self):
+        arena = ma.NodeArena()
+        rng = random.Random(11)
+        hashes = [rng.getrandbits(64) for _ in range(0, 5000)]
+        hashes += [(rng.getrandbits(40) << 24) | (hashes[0] & 0xffffff) for _ in range(0, 20)]
+        for (n, zobrist) in enumerate(hashes):
+            self.assertEqual(arena.add_hash(zobrist, n - 1, n % 4, 2 * n), n)
+        self.assertEqual(len(arena), len(hashes))
+        self.assertGreater(arena.mask + 1, ma.NodeArena.initial_capacity)
+        self.assertLessEqual(2 * len(arena), arena.mask + 1)
+        for (n, zobrist) in enumerate(hashes):
+            self.assertEqual(arena.find(zobrist), n)
+        self.assertEqual(arena.find((rng.getrandbits(40) << 24) | (hashes[0] & 0xffffff)), -1)
+        self.assertEqual(arena.costs[1234], 2468)
+        self.assertEqual(arena.moves_to(5), [1, 2, 3, 0, 1])
+
+    def test_states(self):
+        solver = mso.MazeSolverAStar(maze(*RECTANGULAR))
+        state = solver.compress_initial_state
+        arena = ma.NodeArena()
+        root = arena.add(state, -1, -1, 0)
+        self.assertIn(state, arena)
+        self.assertEqual(arena.node(state), root)
+        (_, _, new_state) = next(iter(state.successors()))
+        self.assertNotIn(new_state, arena)
+        self.assertIsNone(arena.node(new_state))
+
+class TranspositionTableTest(unittest.TestCase):
+    def test_store_seen_learn(self):
+        table = ma.TranspositionTable(1000)
+        self.assertEqual(len(table), 1024)
+        table.store(5, 10, 1)
+        self.assertTrue(table.seen(5, 10, 1))
+        self.assertTrue(table.seen(5, 12, 1))
+        self.assertFalse(table.seen(5, 9, 1))
+        self.assertFalse(table.seen(5, 10, 2))
+        table.learn(5, 30)
+        table.learn(5, 20)
+        self.assertEqual(table.bound(5), 30)
+        self.assertEqual(table.used(), 1)
+
+    # on a collision the current iteration wins, then the state closer to the root
+    def test_replacement(self):
+        table = ma.TranspositionTable(16)
+        table.store(3, 10, 1)
+        table.store(3 + 16, 12, 1)
+        self.assertTrue(table.seen(3, 10, 1))
+        self.assertEqual(table.bound(3 + 16), 0)
+        table.store(3 + 16, 8, 1)
+        self.assertTrue(table.seen(3 + 16, 8, 1))
+        table.store(3, 50, 2)
+        self.assertTrue(table.seen(3, 50, 2))
+        self.assertFalse(table.seen(3 + 16, 8, 1))
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.cache = mc.ResultCache(os.path.join(folder.name, 'cache.sqlite'))
+        self.addCleanup(self.cache.close)
+
+    # a result served from the cache says so in the output file
+    def test_cached_output(self):
+        blocks = []
+        for _ in range(0, 2):
+            solver = mso.MazeSolverAStar(maze(*RECTANGULAR))
+            self.assertTrue(mc.solve_cached(self.cache, 'A*', solver))
+            blocks.append(mp.SolverResult.from_solver('A*', solver).format())
+        self.assertNotIn('Cached', blocks[0])
+        self.assertTrue(blocks[1].endswith('Cached: time and memory are those of an earlier run\n'))
+        self.assertEqual(blocks[0].split('\n')[2], blocks[1].split('\n')[2])
+
+    def solved_level(self):
+        state = maze(*RECTANGULAR)
+        solver = mso.MazeSolverAStar(state)
+        self.assertTrue(mc.solve_cached(self.cache, 'A*', solver))
+        return state, solver
+
+    def test_verify(self):
+        (state, solver) = self.solved_level()
+        self.assertIsNotNone(mc.verify(state, solver.str_path, solver.cost))
+        self.assertIsNone(mc.verify(state, solver.str_path, solver.cost + 1))
+        self.assertIsNone(mc.verify(state, solver.str_path[:-1], solver.cost))
+        self.assertIsNone(mc.verify(state, 'x' + solver.str_path, solver.cost))
+
+    # an entry whose moves do not replay to the goal is dropped, and the level solved again
+    def test_corrupted_path_is_rejected(self):
+        (state, solver) = self.solved_level()
+        self.assertEqual(self.cache.get(state, 'A*').str_path, solver.str_path)
+        self.cache.connection.execute('UPDATE results SET moves = ?', (solver.str_path[:-2],))
+        self.assertIsNone(self.cache.get(state, 'A*'))
+        self.assertEqual(len(self.cache), 0)
+        again = mso.MazeSolverAStar(maze(*RECTANGULAR))
+        self.assertTrue(mc.solve_cached(self.cache, 'A*', again))
+        self.assertFalse(again.cached)
+        self.assertEqual(again.cost, solver.cost)
+
+class PortfolioTest(unittest.TestCase):
+    # workers is only given to the algorithms that take it
+    def test_make_solver_options(self):
+        state = maze(*RECTANGULAR)
+        self.assertEqual(mp.make_solver('HDA*', state, {'workers': 3}).workers, 3)
+        self.assertIsInstance(mp.make_solver('A*', state, {'workers': 3}), mso.MazeSolverAStar)
+
+    # goal_room may rule out the cheapest solution, so a run with it cannot stop the others
+    def test_is_optimal(self):
+        self.assertTrue(mp.is_optimal('A*', {}))
+        self.assertTrue(mp.is_optimal('HDA*', {'macros': ('tunnel',), 'workers': 2}))
+        self.assertFalse(mp.is_optimal('A*', {'macros': ('tunnel', 'goal_room')}))
+        self.assertFalse(mp.is_optimal('UCS', {'macros': ('goal_room',)}))
+        self.assertFalse(mp.is_optimal('DFS', {}))
+
+class MemoryTest(unittest.TestCase):
+    # without tracemalloc, memory comes from the sizes of the search structures
+    def test_memory_from_structures(self):
+        solver = mso.MazeSolverAStar(maze(*RECTANGULAR))
+        self.assertTrue(solver.solve_maze())
+        self.assertGreater(solver.stats.structure_bytes, 0)
+        self.assertEqual(solver.memory_consume, solver.stats.structure_bytes / (1024 * 1024))
+        self.assertIsNone(solver.stats.traced_bytes)
+
+class BenchmarkTest(unittest.TestCase):
+    def record(self, algorithm, nodes, structure_bytes):
+        return {'level': 'input-01.txt#1', 'algorithm': algorithm, 'status': 'solved', 'cost': 405,
+                'nodes': nodes, 'time_ms': 100.0, 'structure_bytes': structure_bytes}
+
+    # the nodes of HDA* depend on scheduling, only those of deterministic algorithms are compared
+    def test_compare_nodes(self):
+        tolerances = {'nodes_tolerance': 0.0, 'time_tolerance': 0.2, 'memory_tolerance': 0.1}
+        for (algorithm, expected) in (('A*', 2), ('HDA*', 0)):
+            changes = mbe.compare([self.record(algorithm, 1000, 5000)],
+                                  [self.record(algorithm, 1200, 9000)], tolerances)
+            self.assertEqual(len(changes), expected)
+
+if __name__ == '__main__':
+    unittest.main()